@@ -0,0 +1,195 @@
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import sol3 as sol
+import test_sol3 as tester
+
+# Synthetic image sizes (rows, cols) that can be benchmarked on top of the images in the "external" folder
+SYNTHETIC_SIZES = {
+    '1080p': (1080, 1920),
+    '4k': (2160, 3840),
+    '8k': (4320, 7680),
+}
+
+FUNCTIONS = ('build_gaussian_pyramid', 'build_laplacian_pyramid', 'laplacian_to_image', 'render_pyramid')
+
+
+# ================================ baselines ================================
+
+
+def _cv2_laplacian_to_image(lpyr):
+    """
+    Reconstructs an image from its laplacian pyramid using the cv2 built in expand.
+    :param lpyr: The laplacian pyramid.
+    :return: The reconstructed image.
+    """
+    im = lpyr[-1]
+    for level in lpyr[-2::-1]:
+        im = cv2.add(cv2.pyrUp(im, dstsize=(level.shape[1], level.shape[0])), level)
+    return im
+
+
+def _numpy_render_pyramid(pyr, levels):
+    """
+    Renders a pyramid into a single image like render_pyramid should, stretching every level to [0, 1].
+    :param pyr: The pyramid.
+    :param levels: Amount of levels to render.
+    :return: The rendered image.
+    """
+    pyr = pyr[:levels]
+    res = np.zeros((pyr[0].shape[0], sum(level.shape[1] for level in pyr)))
+    col = 0
+    for level in pyr:
+        view = res[:level.shape[0], col:col + level.shape[1]]
+        np.subtract(level, level.min(), out=view)
+        view /= max(level.max() - level.min(), np.finfo(np.float64).eps)
+        col += level.shape[1]
+    return res
+
+
+# ================================ benchmark ================================
+
+
+def _best_time(func, repeat):
+    """
+    Times a function.
+    :param func: A function with no arguments.
+    :param repeat: Amount of times to run it.
+    :return: The fastest run time in seconds.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _benchmark_images(sizes):
+    """
+    Generates the images to benchmark on.
+    :param sizes: Names of sizes, 'memes' for the images in the "external" folder or keys of SYNTHETIC_SIZES.
+    :return: A generator of (image, name) tuples.
+    """
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        if size == 'memes':
+            yield from tester.ImageCorpus(tester.IMAGES_DIRECTORY)
+        else:
+            yield rng.random(SYNTHETIC_SIZES[size]), f"synthetic {size}"
+
+
+def _benchmark_cases(im, levels, filter_size):
+    """
+    Builds the benchmark cases of every function on a single image.
+    :param im: The image.
+    :param levels: The max_levels parameter.
+    :param filter_size: The filter_size parameter.
+    :return: A list of (function_name, sol_call, baseline_call) tuples.
+    """
+    filter_vec = sol.build_laplacian_pyramid(im, levels, filter_size)[1]
+    gaussian_pyr = tester._cv2_build_gaussian_pyramid(im, levels)
+    laplacian_pyr = tester._cv2_build_laplacian_pyramid(gaussian_pyr)
+    coeff = np.ones(len(laplacian_pyr))
+
+    return [
+        ('build_gaussian_pyramid',
+         lambda: sol.build_gaussian_pyramid(im, levels, filter_size),
+         lambda: tester._cv2_build_gaussian_pyramid(im, levels)),
+        ('build_laplacian_pyramid',
+         lambda: sol.build_laplacian_pyramid(im, levels, filter_size),
+         lambda: tester._cv2_build_laplacian_pyramid(tester._cv2_build_gaussian_pyramid(im, levels))),
+        ('laplacian_to_image',
+         lambda: sol.laplacian_to_image([level.copy() for level in laplacian_pyr], filter_vec, coeff),
+         lambda: _cv2_laplacian_to_image(laplacian_pyr)),
+        ('render_pyramid',
+         lambda: sol.render_pyramid([level.copy() for level in gaussian_pyr], levels),
+         lambda: _numpy_render_pyramid(gaussian_pyr, levels)),
+    ]
+
+
+def run_benchmark(sizes, filter_sizes, levels_list, functions, repeat):
+    """
+    Times the sol3 functions against their baselines over a grid of images, filter sizes and levels.
+    :param sizes: Names of the image sizes, see "_benchmark_images".
+    :param filter_sizes: The filter sizes to benchmark.
+    :param levels_list: The max_levels values to benchmark.
+    :param functions: Names of the functions to benchmark.
+    :param repeat: Amount of runs per case, the fastest one is used.
+    :return: A generator of result dicts, one per case.
+    """
+    for im, im_name in _benchmark_images(sizes):
+        megapixels = im.size / 1e6
+        for levels in levels_list:
+            for filter_size in filter_sizes:
+                for name, sol_call, baseline_call in _benchmark_cases(im, levels, filter_size):
+                    if name not in functions:
+                        continue
+                    sol_time = _best_time(sol_call, repeat)
+                    baseline_time = _best_time(baseline_call, repeat)
+                    yield {
+                        'function': name,
+                        'image': im_name,
+                        'shape': im.shape,
+                        'filter_size': filter_size,
+                        'levels': levels,
+                        'time': sol_time,
+                        'throughput': megapixels / sol_time,
+                        'baseline_time': baseline_time,
+                        'slowdown': sol_time / baseline_time,
+                    }
+
+
+def _format_result(result):
+    """
+    Formats a benchmark result into a single report line.
+    :param result: The result.
+    :return: The line.
+    """
+    shape = f"{result['shape'][0]}x{result['shape'][1]}"
+    return (f"{result['function']:<24}{result['image']:<22}{shape:>11}{result['filter_size']:>7}{result['levels']:>7}"
+            f"{result['time']:>10.4f}{result['throughput']:>10.2f}{result['baseline_time']:>10.4f}"
+            f"{result['slowdown']:>10.1f}x")
+
+
+def _parse_args():
+    """
+    Parses the command line arguments of the benchmark.
+    :return: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks the sol3 pyramid functions against cv2 based baselines. "
+                                                 "The cv2 baselines always use a 5x5 filter, so the slowdown of other "
+                                                 "filter sizes is only a rough comparison.")
+    parser.add_argument('--sizes', nargs='+', default=['memes', '4k', '8k'],
+                        choices=['memes'] + list(SYNTHETIC_SIZES),
+                        help="Images to benchmark on, 'memes' are the images in the external folder.")
+    parser.add_argument('--filter-sizes', nargs='+', type=int, default=[3, 5, 7, 9])
+    parser.add_argument('--levels', nargs='+', type=int, default=[4])
+    parser.add_argument('--functions', nargs='+', default=list(FUNCTIONS), choices=FUNCTIONS)
+    parser.add_argument('--repeat', type=int, default=3, help="Amount of runs per case, the fastest one is used.")
+    parser.add_argument('--max-slowdown', type=float,
+                        help="Fails (exit code 1) if any function is more than this many times slower than its "
+                             "baseline.")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+
+    print(f"{'function':<24}{'image':<22}{'shape':>11}{'filter':>7}{'levels':>7}"
+          f"{'sol [s]':>10}{'MP/s':>10}{'base [s]':>10}{'slowdown':>11}")
+    over_budget = []
+    for result in run_benchmark(args.sizes, args.filter_sizes, args.levels, args.functions, args.repeat):
+        print(_format_result(result), flush=True)
+        if args.max_slowdown is not None and result['slowdown'] > args.max_slowdown:
+            over_budget.append(result)
+
+    if over_budget:
+        print(f"\n{len(over_budget)} cases are more than {args.max_slowdown}x slower than the baseline:")
+        for result in over_budget:
+            print(_format_result(result))
+        sys.exit(1)
@@ -0,0 +1,142 @@
+import os
+import sys
+import argparse
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+# The weights skimage.color.rgb2gray uses, in the BGR order of cv2
+_GRAY_WEIGHTS = np.array([[0.0721, 0.7154, 0.2125]])
+
+# Decode flags per reduction factor, JPEGs are scaled down by their decoder (skipping most of the work) and other
+# formats are decoded fully and then resized. The EXIF orientation is ignored like imageio does, so photos keep the
+# shape they had.
+REDUCTION_FLAGS = {
+    1: cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION,
+    2: cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+    4: cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+    8: cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION,
+}
+
+# Max difference from the imageio + rgb2gray decode this module replaced (see "verify"). The grayscale levels are
+# rounded to 8 bits (half a level), and libjpeg builds may differ by another level in their inverse DCT.
+TOLERANCE = 2 / 255
+
+
+def decode(filename, representation, reduction=1, min_side=0):
+    """
+    Decodes an image file into an 8 bit image, grayscale images are converted straight from the decoded BGR pixels.
+    :param filename: The file name of an image on disk (could be grayscale or RGB).
+    :param representation: 1 for a grayscale image, 2 for an RGB one.
+    :param reduction: Factor to scale the image down by while decoding, a key of REDUCTION_FLAGS.
+    :param min_side: The image is scaled down by a lower factor (down to 1) if its shorter side would be shorter than
+                     this.
+    :return: An uint8 image, (rows, cols) for grayscale and (rows, cols, 3) for RGB.
+    """
+    assert representation in [1, 2]
+
+    # Unlike cv2.imread, reads paths that are not ascii on windows too
+    data = np.fromfile(filename, np.uint8)
+    im = cv2.imdecode(data, REDUCTION_FLAGS[reduction])
+    if im is not None and reduction > 1 and min(im.shape[:2]) < min_side:
+        full_side = min(im.shape[:2]) * reduction
+        while reduction > 1 and full_side // reduction < min_side:
+            reduction //= 2
+        im = cv2.imdecode(data, REDUCTION_FLAGS[reduction])
+    if im is None:
+        raise IOError(f"could not decode {filename}")
+    if representation == 1:
+        return cv2.transform(im, _GRAY_WEIGHTS)
+    return cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+
+
+def to_float(im, dtype=np.float64, out=None):
+    """
+    Converts an 8 bit image to a floating point one in a single pass.
+    :param im: The uint8 image.
+    :param dtype: The floating point type of the output, ignored when out is given.
+    :param out: A preallocated array of the image's shape to write into (e.g. a memory mapped file), or None.
+    :return: The image with intensities normalized to the range [0,1], out if it was given.
+    """
+    if out is None:
+        out = np.empty(im.shape, dtype)
+    return np.divide(im, 255, out=out, dtype=out.dtype)
+
+
+def read_image(filename, representation, dtype=np.float64, reduction=1, min_side=0):
+    """
+    Receives an image file and converts it into one of two given representations.
+    :param filename: The file name of an image on disk (could be grayscale or RGB).
+    :param representation: representation code, either 1 or 2 defining wether the output
+    should be a grayscale image (1) or an RGB image (2). If the input image is grayscale,
+    we won't call it with representation = 2.
+    :param dtype: The floating point type of the output.
+    :param reduction: Factor to scale the image down by while decoding, see "decode".
+    :param min_side: Shortest side the image may be scaled down to, see "decode".
+    :return: An image, represented by a matrix of type dtype (np.float64 by default) with intensities
+    normalized to the range [0,1].
+    """
+    return to_float(decode(filename, representation, reduction, min_side), dtype)
+
+
+# ================================ verification ================================
+
+
+def _reference_read_image(filename, representation):
+    """
+    The imageio and skimage based read_image this module replaced, kept to verify it against.
+    """
+    try:
+        from imageio.v2 import imread
+    except ImportError:
+        from imageio import imread
+    from skimage.color import rgb2gray
+
+    im = imread(filename)
+    if representation == 1 and len(im.shape) == 3:
+        im = rgb2gray(im)
+    im_float = im.astype(np.float64)
+    if im_float.max() > 1:
+        im_float = im_float / 255
+    return im_float
+
+
+def verify(filename, representation=1):
+    """
+    Compares the decode of an image with the one of the imageio and skimage based read_image.
+    :param filename: The file name of an image on disk.
+    :param representation: The representation code, see "read_image".
+    :return: The max absolute difference between the two, inf if their shapes differ.
+    """
+    expected = _reference_read_image(filename, representation)
+    im = read_image(filename, representation)
+    if im.shape != expected.shape:
+        return np.inf
+    return float(np.max(np.abs(im - expected)))
+
+
+def _parse_args():
+    """
+    Parses the command line arguments of the verification.
+    :return: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Checks that the cv2 decode of images matches the imageio and "
+                                                 "skimage one within the tolerance (needs imageio and scikit-image).")
+    parser.add_argument('paths', nargs='+', help="Images, or directories of images.")
+    parser.add_argument('--representation', type=int, choices=[1, 2], default=1)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    failed = 0
+    for path in args.paths:
+        filenames = [path] if not os.path.isdir(path) else [
+            os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(IMAGE_EXTENSIONS)]
+        for filename in filenames:
+            difference = verify(filename, args.representation)
+            failed += difference > TOLERANCE
+            print(f"{difference * 255:8.2f}/255  {'OK' if difference <= TOLERANCE else 'FAILED'}  {filename}")
+    sys.exit(1 if failed else 0)
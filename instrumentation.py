@@ -0,0 +1,248 @@
+import sys
+import time
+import json
+import importlib.util
+import tracemalloc
+import cProfile
+from contextlib import contextmanager
+
+# Kinds of measurements
+SETUP, TEST, CASE = 'setup', 'test', 'case'
+
+
+class _Measurement:
+    """A measurement that is still running"""
+
+    __slots__ = ('name', 'kind', 'parameters', 'wall_start', 'cpu_start', 'memory_start', 'peak')
+
+    def __init__(self, name, kind, parameters):
+        self.name = name
+        self.kind = kind
+        self.parameters = parameters
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.memory_start = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.peak = 0
+
+
+class Recorder:
+    """
+    Records the wall time, cpu time and (when tracemalloc is tracing) the peak memory of tests and of the cases inside
+    them. Measurements may be nested, a case measured inside a test is recorded with the test's name.
+    Listeners (functions of a record) are called with every record as soon as it is made.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.listeners = []
+        self._running = []
+
+    def start(self, name, kind, **parameters):
+        """
+        Starts a measurement.
+        :param name: Name of the measured test/case.
+        :param kind: SETUP, TEST or CASE.
+        :param parameters: Parameters of the measured case, must be JSON serializable.
+        :return: The running measurement, to pass to "stop".
+        """
+        if tracemalloc.is_tracing():
+            # The peak is reset for every measurement, so the enclosing ones keep the peak they reached so far
+            peak = tracemalloc.get_traced_memory()[1]
+            for measurement in self._running:
+                measurement.peak = max(measurement.peak, peak)
+            tracemalloc.reset_peak()
+
+        measurement = _Measurement(name, kind, parameters)
+        self._running.append(measurement)
+        return measurement
+
+    def stop(self, measurement, outcome=None, message=None):
+        """
+        Stops a running measurement and records it.
+        :param measurement: The value returned by "start".
+        :param outcome: 'success', the name of the exception that stopped the measured code, or None if unknown.
+        :param message: The message of the exception that stopped the measured code.
+        :return: The record.
+        """
+        self._running.remove(measurement)
+        peak_memory = None
+        if measurement.memory_start is not None and tracemalloc.is_tracing():
+            peak = max(measurement.peak, tracemalloc.get_traced_memory()[1])
+            peak_memory = max(peak - measurement.memory_start, 0)
+            for running in self._running:
+                running.peak = max(running.peak, peak)
+
+        return self.add(measurement.name, measurement.kind, time.perf_counter() - measurement.wall_start,
+                        time.process_time() - measurement.cpu_start, outcome, peak_memory, message,
+                        **measurement.parameters)
+
+    def add(self, name, kind, wall, cpu, outcome=None, peak_memory=None, message=None, **parameters):
+        """
+        Records a measurement that was made elsewhere, e.g. in another thread.
+        :param name: Name of the measured test/case.
+        :param kind: SETUP, TEST or CASE.
+        :param wall: The wall time in seconds.
+        :param cpu: The cpu time in seconds.
+        :param outcome: 'success', the name of the exception that stopped the measured code, or None if unknown.
+        :param peak_memory: The peak memory in bytes, or None if it was not traced.
+        :param message: The message of the exception that stopped the measured code.
+        :param parameters: Parameters of the measured case, must be JSON serializable.
+        :return: The record.
+        """
+        record = {
+            'name': name,
+            'kind': kind,
+            'test': self._running[0].name if self._running else name,
+            'parameters': parameters,
+            'outcome': outcome,
+            'message': message,
+            'wall': wall,
+            'cpu': cpu,
+            'peak_memory': peak_memory,
+        }
+        self.records.append(record)
+        for listener in self.listeners:
+            listener(record)
+        return record
+
+    @contextmanager
+    def measure(self, name, kind, **parameters):
+        """
+        Measures the code inside the with statement, see "start".
+        """
+        measurement = self.start(name, kind, **parameters)
+        outcome, message = 'success', None
+        try:
+            yield measurement
+        except BaseException as e:
+            outcome, message = type(e).__name__, str(e)
+            raise
+        finally:
+            self.stop(measurement, outcome, message)
+
+    @contextmanager
+    def report(self, name, kind, wall, cpu, **parameters):
+        """
+        Records a measurement that was made elsewhere (see "add") once the code inside the with statement, e.g. the
+        checks of the measured code's result, ends. The outcome of that code is the outcome of the record.
+        """
+        outcome, message = 'success', None
+        try:
+            yield
+        except BaseException as e:
+            outcome, message = type(e).__name__, str(e)
+            raise
+        finally:
+            self.add(name, kind, wall, cpu, outcome, message=message, **parameters)
+
+    def drain(self):
+        """
+        Removes all of the records, used to send the records of a worker process to the main one.
+        :return: The removed records.
+        """
+        records, self.records = self.records, []
+        return records
+
+    def extend(self, records):
+        """
+        Adds records that were made elsewhere (e.g. in a worker process), and passes them to the listeners.
+        :param records: The records to add.
+        """
+        self.records.extend(records)
+        for record in records:
+            for listener in self.listeners:
+                listener(record)
+
+    def tests(self):
+        """
+        Aggregates the test records by name, tests that were split into several cases (e.g. when running on a pool)
+        add up their times and take the highest peak memory.
+        :return: A list of test records.
+        """
+        tests = {}
+        for record in self.records:
+            if record['kind'] != TEST:
+                continue
+            if record['name'] not in tests:
+                tests[record['name']] = dict(record)
+                continue
+            test = tests[record['name']]
+            test['wall'] += record['wall']
+            test['cpu'] += record['cpu']
+            if record['peak_memory'] is not None:
+                test['peak_memory'] = max(test['peak_memory'] or 0, record['peak_memory'])
+        return list(tests.values())
+
+    def slowest(self, amount, kind=CASE):
+        """
+        :param amount: Amount of records to return.
+        :param kind: The kind of the records.
+        :return: The "amount" records of the given kind with the longest wall time, slowest first.
+        """
+        records = self.tests() if kind == TEST else [record for record in self.records if record['kind'] == kind]
+        return sorted(records, key=lambda record: record['wall'], reverse=True)[:amount]
+
+    def write_json(self, path):
+        """
+        Writes all of the records to a JSON file.
+        :param path: Path of the file.
+        """
+        with open(path, 'w') as json_file:
+            json.dump({'tests': self.tests(), 'records': self.records}, json_file, indent=2)
+
+
+def format_record(record):
+    """
+    Formats a record into a single report line.
+    :param record: The record.
+    :return: The line.
+    """
+    peak = '' if record['peak_memory'] is None else f"{record['peak_memory'] / 2 ** 20:9.1f}MB peak  "
+    parameters = ", ".join(f"{key}={value}" for key, value in record['parameters'].items())
+    return f"{record['wall']:8.2f}s wall {record['cpu']:8.2f}s cpu  {peak}{record['name']}" + \
+           (f" ({parameters})" if parameters else "")
+
+
+def lazy_import(name):
+    """
+    Imports a module lazily, it is only executed when one of its attributes is first used. Keeps heavy modules that
+    may not be needed (or not needed yet) from slowing down the start of every process.
+    The module must be first used by a single thread, a thread that uses it while another one executes it may see a
+    partially executed module.
+    :param name: The name of the module.
+    :return: The module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# The profilers of the stats files this process writes, by path
+_PROFILERS = {}
+
+
+@contextmanager
+def profile(path):
+    """
+    Runs the code inside the with statement under cProfile, and dumps the stats to a file. The stats of every with
+    statement of the same path add up, so a pool worker that runs several cases of a test writes all of them.
+    :param path: Path of the stats file, can be read using the pstats module.
+    """
+    profiler = _PROFILERS.setdefault(path, cProfile.Profile())
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+# The recorder the tests report to, every process has its own
+RECORDER = Recorder()
@@ -0,0 +1,131 @@
+import json
+import xml.etree.ElementTree as ElementTree
+
+from instrumentation import CASE
+
+SUCCESS, FAILURE, ERROR, SKIP = 'success', 'failure', 'error', 'skip'
+
+# A case that ran out of memory or went over its limits (see --isolate), its test did not pass but did not crash either
+RESOURCE_EXCEEDED = 'resource_exceeded'
+
+
+def _exception_message(traceback):
+    """
+    Extracts the exception and its message from a traceback string.
+    :param traceback: The traceback.
+    :return: The lines that follow the last frame of the traceback.
+    """
+    lines = traceback.strip().splitlines()
+    start = max((i + 1 for i, line in enumerate(lines) if line.startswith('  File ')), default=0)
+    while start < len(lines) and lines[start].startswith(' '):
+        start += 1
+    return "\n".join(lines[start:])
+
+
+class JsonLinesReporter:
+    """
+    Streams the results to a file as JSON lines, a record per case as soon as it finishes and a record per test when it
+    ends. Every line is flushed, so a running file can be followed (e.g. with "tail -f") and files of several machines
+    can be concatenated.
+    Test records: {"type": "test", "name", "outcome", "message", "duration", "cases"}.
+    Case records: {"type": "case", "name", "test", "parameters", "outcome", "message", "duration", "cpu"}.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the file, it is overwritten.
+        """
+        self._file = open(path, 'w')
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def case(self, record):
+        """
+        Reports a measurement record, see instrumentation.Recorder, only the CASE records are written.
+        :param record: The record.
+        :return: -
+        """
+        if record['kind'] != CASE:
+            return
+        self._write({
+            'type': CASE,
+            'name': record['name'],
+            'test': record['test'],
+            'parameters': record['parameters'],
+            'outcome': record['outcome'],
+            'message': record['message'],
+            'duration': record['wall'],
+            'cpu': record['cpu'],
+        })
+
+    def test(self, name, outcome, message, duration, cases=None):
+        """
+        Reports the result of a test.
+        :param name: The id of the test.
+        :param outcome: SUCCESS, FAILURE, ERROR, RESOURCE_EXCEEDED or SKIP.
+        :param message: The raw traceback of a failure/error, or the reason of a skip.
+        :param duration: The wall time of the test in seconds.
+        :param cases: Counts of the test's cases that ran, passed and were skipped.
+        :return: -
+        """
+        self._write({'type': 'test', 'name': name, 'outcome': outcome, 'message': message, 'duration': duration,
+                     'cases': cases})
+
+    def close(self):
+        self._file.close()
+
+
+class JUnitReporter:
+    """
+    Collects the results of the tests, and writes them as a JUnit XML file when closed.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the file, it is overwritten.
+        """
+        self.path = path
+        self._tests = []
+
+    def case(self, record):
+        """
+        Cases are not reported on their own, their failures are a part of their test's message.
+        """
+
+    def test(self, name, outcome, message, duration, cases=None):
+        """
+        Reports the result of a test, see "JsonLinesReporter.test".
+        """
+        self._tests.append((name, outcome, message, duration))
+
+    def close(self):
+        """
+        Writes the file.
+        :return: -
+        """
+        suite = ElementTree.Element('testsuite', {
+            'name': 'test_sol3',
+            'tests': str(len(self._tests)),
+            'failures': str(sum(outcome == FAILURE for _, outcome, _, _ in self._tests)),
+            'errors': str(sum(outcome in (ERROR, RESOURCE_EXCEEDED) for _, outcome, _, _ in self._tests)),
+            'skipped': str(sum(outcome == SKIP for _, outcome, _, _ in self._tests)),
+            'time': f"{sum(duration for _, _, _, duration in self._tests):.3f}",
+        })
+        for name, outcome, message, duration in self._tests:
+            class_name, _, method_name = name.rpartition('.')
+            test_case = ElementTree.SubElement(suite, 'testcase', {'classname': class_name, 'name': method_name,
+                                                                   'time': f"{duration:.3f}"})
+            if outcome in (FAILURE, ERROR):
+                element = ElementTree.SubElement(test_case, outcome, {'message': _exception_message(message)})
+                element.text = message
+            elif outcome == RESOURCE_EXCEEDED:
+                # JUnit has no such outcome, it is reported as an error of its own type
+                element = ElementTree.SubElement(test_case, ERROR, {'message': _exception_message(message),
+                                                                    'type': RESOURCE_EXCEEDED})
+                element.text = message
+            elif outcome == SKIP:
+                ElementTree.SubElement(test_case, 'skipped', {'message': message})
+
+        ElementTree.ElementTree(suite).write(self.path, encoding='utf-8', xml_declaration=True)
@@ -1,7 +1,26 @@
 import unittest.runner
 import itertools
-import test_sol3 as tester
 import re
+import os
+import sys
+import ast
+import json
+import hashlib
+import inspect
+import sysconfig
+import secrets
+import site
+import time
+import argparse
+import subprocess
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from instrumentation import RECORDER, TEST, CASE, format_record, lazy_import
+from reporting import SUCCESS, FAILURE, ERROR, SKIP, RESOURCE_EXCEEDED, JsonLinesReporter, JUnitReporter
+from sandbox import SandboxExecutor, WorkerDied
+
+# The tests (and the solution they import) are only loaded once they are needed, so e.g. "--help" starts instantly
+tester = lazy_import('test_sol3')
 
 DOGGO ="          _ _\n\
      _(,_/ \ \____________\n\
@@ -27,10 +46,18 @@ YOU_FAILED = "❚█══YOU FAILED══█❚"
 class CustomTextTestResult(unittest.runner.TextTestResult):
     """Extension of TextTestResult to support numbering test cases"""
 
+    # Machine readable reporters (see the reporting module) every test outcome is passed to
+    reporters = ()
+
     def __init__(self, stream, descriptions, verbosity):
         """Initializes the test number generator, then calls super impl"""
 
         self.test_numbers = itertools.count(1)
+        self.outcomes = {}
+        self.case_counts = {}
+
+        # Tests that did not run all of their cases because a time budget was over
+        self.budget_skipped = []
         stream.write(f"================================================\n            ==== Starting Tests ====\n================================================\n")
         return super(CustomTextTestResult, self).__init__(stream, descriptions, verbosity)
 
@@ -46,28 +73,92 @@ class CustomTextTestResult(unittest.runner.TextTestResult):
             # _exec_info_to_string method:
             test.progress_index = progress
 
+        self.start_time = time.perf_counter()
         return super(CustomTextTestResult, self).startTest(test)
 
+    def stopTest(self, test):
+        """Calls super impl, then passes the outcome of the test to the reporters"""
+
+        super(CustomTextTestResult, self).stopTest(test)
+        outcome, info = self.outcomes.get(test.id(), (None, ""))
+        self.case_counts[test.id()] = dict(getattr(test, 'case_counts', {}))
+        if self.case_counts[test.id()].get('skipped') and test not in self.budget_skipped:
+            self.budget_skipped.append(test)
+        # A test that ran on a pool took the time its workers measured, not the time its outcome took to replay here
+        duration = getattr(test, 'worker_time', None)
+        if duration is None:
+            duration = time.perf_counter() - self.start_time
+        for reporter in self.reporters:
+            reporter.test(test.id(), outcome, info, duration, self.case_counts[test.id()])
+
     def addSuccess(self, test):
+        # A test that passed only some of its cases did not pass
+        if getattr(test, 'case_counts', {}).get('skipped'):
+            self.addSkip(test, f"only a part of its cases ran{_case_summary(test)}")
+            return
+
         super(CustomTextTestResult, self).addSuccess(test)
+        self.outcomes[test.id()] = (SUCCESS, "")
         if self.showAll:
-            self.stream.writeln("✔ You passed ✔")
+            self.stream.writeln(f"✔ You passed ✔{_case_summary(test)}")
         elif self.dots:
             self.stream.write('.')
             self.stream.flush()
 
     def addFailure(self, test, err):
         super(CustomTextTestResult, self).addFailure(test, err)
+        self.outcomes[test.id()] = (FAILURE, super(CustomTextTestResult, self)._exc_info_to_string(err, test))
         if self.showAll:
-            self.stream.writeln("❌ You failed ❌")
+            self.stream.writeln(f"❌ You failed ❌{_case_summary(test)}")
         elif self.dots:
             self.stream.write('F')
             self.stream.flush()
 
+    def addError(self, test, err):
+        super(CustomTextTestResult, self).addError(test, err)
+        self.outcomes[test.id()] = (ERROR, super(CustomTextTestResult, self)._exc_info_to_string(err, test))
+
+    def addSkip(self, test, reason):
+        super(CustomTextTestResult, self).addSkip(test, reason)
+        self.outcomes[test.id()] = (SKIP, reason)
+        if reason == tester.BUDGET_SKIP_REASON or getattr(test, 'case_counts', {}).get('skipped'):
+            self.budget_skipped.append(test)
+
+    def addReplayedOutcome(self, test, outcome, info):
+        """Records an outcome that was computed elsewhere (e.g. in a worker process) as if the test ran here"""
+
+        if outcome == SUCCESS:
+            self.addSuccess(test)
+        elif outcome == SKIP:
+            self.addSkip(test, info)
+        elif outcome == FAILURE:
+            self.outcomes[test.id()] = (outcome, info)
+            self.failures.append((test, self._decorate_info(info, test)))
+            if self.showAll:
+                self.stream.writeln(f"❌ You failed ❌{_case_summary(test)}")
+            elif self.dots:
+                self.stream.write('F')
+                self.stream.flush()
+        else:
+            self.outcomes[test.id()] = (outcome, info)
+            self.errors.append((test, self._decorate_info(info, test)))
+            if self.showAll:
+                self.stream.writeln("RESOURCE EXCEEDED" if outcome == RESOURCE_EXCEEDED else "ERROR")
+            elif self.dots:
+                self.stream.write('E')
+                self.stream.flush()
+
+        if outcome in (FAILURE, ERROR, RESOURCE_EXCEEDED) and self.failfast:
+            self.stop()
+
     def _exc_info_to_string(self, err, test):
         """Gets an exception info string from super, and prepends 'Test Number' line"""
 
         info = super(CustomTextTestResult, self)._exc_info_to_string(err, test)
+        return self._decorate_info(info, test)
+
+    def _decorate_info(self, info, test):
+        """Prepends the 'Test Number' line to an exception info string and highlights the assertion message"""
 
         if self.showAll:
             info = 'Test number: {index}\n{info}'.format(
@@ -78,11 +169,34 @@ class CustomTextTestResult(unittest.runner.TextTestResult):
         return info
 
 
+def _case_summary(test):
+    """
+    Summarizes how many of a test's cases ran, passed and were skipped.
+    :param test: The test.
+    :return: The summary, an empty string if the test did not run any cases.
+    """
+    counts = getattr(test, 'case_counts', None)
+    if not counts or not (counts['ran'] or counts['skipped']):
+        return ""
+    summary = f" ({counts['ran']} cases ran, {counts['passed']} passed"
+    if counts['skipped']:
+        summary += f", {counts['skipped']} skipped by the time budget"
+    return summary + ")"
+
+
 class CustomTextTestRunner(unittest.runner.TextTestRunner):
     """Extension of TextTestRunner to support numbering test cases"""
 
     resultclass = CustomTextTestResult
 
+    def __init__(self, *args, reporters=(), **kwargs):
+        """
+        :param reporters: Machine readable reporters (see the reporting module) the results are passed to, on top of
+                          the text output.
+        """
+        super(CustomTextTestRunner, self).__init__(*args, **kwargs)
+        self.reporters = reporters
+
     def run(self, test):
         """Stores the total count of test cases, then calls super impl"""
 
@@ -94,11 +208,399 @@ class CustomTextTestRunner(unittest.runner.TextTestRunner):
 
         result = super(CustomTextTestRunner, self)._makeResult()
         result.test_case_count = self.test_case_count
+        result.reporters = self.reporters
+        return result
+
+
+# ================================ parallel execution ================================
+
+# Tests that run random stress matrices on top of the images, their stress part is sent to the pool as its own case.
+STRESS_TESTS = ('test_build_gaussian_pyramid_random', 'test_build_laplacian_pyramid_random')
+
+# Tests that do not use the images, they are sent to the pool as a single case.
+IMAGELESS_TESTS = ('test_build_pyramids_tiled',)
+
+# Tests that draw from the seed although they are not named "*_random", it is part of their fingerprint.
+SEEDED_TESTS = ('test_build_pyramids_tiled',)
+
+
+class _CaseResult(unittest.TestResult):
+    """A silent TestResult that summarizes a single case into a picklable (outcome, info) pair"""
+
+    memory_errors = 0
+
+    def addError(self, test, err):
+        super(_CaseResult, self).addError(test, err)
+        if issubclass(err[0], MemoryError):
+            self.memory_errors += 1
+
+    def outcome(self):
+        """Returns the (outcome, info) pair of the case that was run into this result"""
+
+        if self.errors:
+            # Running out of memory (e.g. over the --case-memory-limit) is not an error of the solution's logic
+            kind = RESOURCE_EXCEEDED if self.memory_errors == len(self.errors) else ERROR
+            return kind, "\n".join(info for _, info in self.errors)
+        if self.failures:
+            return FAILURE, "\n".join(info for _, info in self.failures)
+        if self.skipped:
+            return SKIP, self.skipped[0][1]
+        return SUCCESS, ""
+
+
+def _split_test(test):
+    """
+    Splits a test method into the cases that are sent to the pool, one case per image (and one for stress matrices).
+    :param test: A TestEx3 instance.
+    :return: A list of (method_name, image_names, run_stress) tuples.
+    """
+    method_name = test._testMethodName
+    if method_name in IMAGELESS_TESTS:
+        return [(method_name, (), True)]
+    cases = [(method_name, (name,), False) for name in tester.ImageCorpus(tester._corpus_source()).names]
+    if method_name in STRESS_TESTS or not cases:
+        cases.append((method_name, (), True))
+    return cases
+
+
+def _init_worker():
+    """
+    Initializes a pool worker, the records it makes are sent back to the main process rather than reported from here.
+    Workers that are started late (e.g. recycled sandbox workers) drop the records they inherited from the main
+    process, so they are not sent back again.
+    :return: -
+    """
+    RECORDER.listeners.clear()
+    RECORDER.drain()
+
+
+def _run_case(case):
+    """
+    Runs a single case of a test method, this is the function the pool workers execute.
+    :param case: A (method_name, image_names, run_stress) tuple as generated by "_split_test".
+    :return: The (outcome, info, records, case_counts) tuple of the case, records are the timing records made while
+             running it and case_counts are the counts of the sub-cases that ran, passed and were skipped.
+    """
+    method_name, image_names, run_stress = case
+    tester.TestEx3.image_names = image_names
+    tester.TestEx3.run_stress = run_stress
+
+    result = _CaseResult()
+    test = tester.TestEx3(method_name)
+    unittest.TestSuite([test]).run(result)
+    outcome, info = result.outcome()
+    if outcome in (FAILURE, ERROR, RESOURCE_EXCEEDED):
+        info = f"{_describe_case(case)}\n{info}"
+    return outcome, info, RECORDER.drain(), getattr(test, 'case_counts', Counter())
+
+
+def _describe_case(case):
+    """
+    :param case: A (method_name, image_names, run_stress) tuple as generated by "_split_test".
+    :return: A line that names the images of the case, added to its failures.
+    """
+    return f"Pool case: {', '.join(case[1]) or 'stress matrices'}"
+
+
+def _case_result(case, future):
+    """
+    Waits for the result of a case that was sent to the pool.
+    :param case: The case, see "_split_test".
+    :param future: The future of its "_run_case".
+    :return: The (outcome, info, records, case_counts) tuple of the case, a case whose sandbox worker died (or that
+             could not send its result back) has no records or counts.
+    """
+    try:
+        return future.result()
+    except WorkerDied as e:
+        return RESOURCE_EXCEEDED if e.resource_exceeded else ERROR, f"{_describe_case(case)}\n{e}", [], Counter()
+    except Exception as e:
+        outcome = RESOURCE_EXCEEDED if isinstance(e, MemoryError) else ERROR
+        return outcome, f"{_describe_case(case)}\n{type(e).__name__}: {e}", [], Counter()
+
+
+def _merge_outcomes(outcomes):
+    """
+    Merges the outcomes of all the cases of a single test method into the outcome of the method.
+    :param outcomes: A list of (outcome, info) pairs.
+    :return: The worst outcome (resource exceeded > error > failure > success > skip) and all of the matching infos.
+    """
+    for kind in (RESOURCE_EXCEEDED, ERROR, FAILURE):
+        infos = [info for outcome, info in outcomes if outcome == kind]
+        if infos:
+            return kind, "\n".join(infos)
+    if all(outcome == SKIP for outcome, _ in outcomes):
+        return SKIP, outcomes[0][1]
+    return SUCCESS, ""
+
+
+class ParallelTestSuite(unittest.TestSuite):
+    """
+    A TestSuite that runs its tests' cases on a process pool, then reports them in order to the result. With failfast
+    the cases that did not start yet are cancelled after the first failure.
+    """
+
+    def __init__(self, tests=(), workers=1, sandbox=None):
+        """
+        :param workers: Amount of processes.
+        :param sandbox: None to run the cases on a ProcessPoolExecutor, or the limits of a SandboxExecutor (a dict of
+                        its memory_limit, cpu_limit and max_tasks) to run every case in a limited worker.
+        """
+        super(ParallelTestSuite, self).__init__(tests)
+        self.workers = workers
+        self.sandbox = sandbox
+
+    def _make_pool(self):
+        """Creates the executor the cases run on"""
+
+        if self.sandbox is None:
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return SandboxExecutor(self.workers, initializer=_init_worker, **self.sandbox)
+
+    def run(self, result, debug=False):
+        """Sends every case to the pool, and replays the merged outcome of each test as soon as it is ready"""
+
+        tests = list(self)
+        with self._make_pool() as pool:
+            futures = [[] if isinstance(test, CachedTest) else [(case, pool.submit(_run_case, case)) for case in
+                                                                _split_test(test)] for test in tests]
+            for test, test_futures in zip(tests, futures):
+                if result.shouldStop:
+                    break
+                if isinstance(test, CachedTest):
+                    test(result)
+                    continue
+                result.startTest(test)
+                outcomes = []
+                test.case_counts = Counter()
+                test.worker_time = 0.0
+                for case, future in test_futures:
+                    outcome, info, records, case_counts = _case_result(case, future)
+                    outcomes.append((outcome, info))
+                    RECORDER.extend(records)
+                    test.case_counts.update(case_counts)
+                    test.worker_time += sum(record['wall'] for record in records if record['kind'] == TEST)
+                    if outcome in (FAILURE, ERROR, RESOURCE_EXCEEDED) and result.failfast:
+                        break
+                outcome, info = _merge_outcomes(outcomes)
+                result.addReplayedOutcome(test, outcome, info)
+                result.stopTest(test)
+
+            pool.shutdown(wait=False, cancel_futures=True)
         return result
 
 
 
 
+# ================================ incremental runs ================================
+
+
+INCREMENTAL_STATE = '.ex3_incremental.json'
+
+# Settings that can not change the outcome of a test (the seed is only added to the random tests), so they are left out
+# of its fingerprint
+_UNFINGERPRINTED_SETTINGS = ('EX3_IMAGE_CACHE', 'EX3_TRACE_MEMORY', 'EX3_CPROFILE', 'EX3_SEED', 'EX3_DEADLINE')
+
+
+class CachedTest:
+    """Stands in for a test whose inputs did not change since its last run, and replays its previous outcome"""
+
+    def __init__(self, test, outcome, info):
+        self.test = test
+        self.outcome = outcome
+        self.info = info
+
+    def __call__(self, result):
+        result.startTest(self.test)
+        result.addReplayedOutcome(self.test, self.outcome, self.info)
+        result.stopTest(self.test)
+
+    def countTestCases(self):
+        return 1
+
+    def __str__(self):
+        return str(self.test)
+
+
+# Directories of the standard library and of the installed packages (including the "pip install --user" ones), modules
+# outside of them are local (the student's or the tests' own) and are part of the fingerprints
+_LIBRARY_DIRECTORIES = tuple({os.path.join(os.path.realpath(path), '') for path in
+                              [path for name, path in sysconfig.get_paths().items() if
+                               name in ('stdlib', 'platstdlib', 'purelib', 'platlib')] +
+                              site.getsitepackages() + [site.getusersitepackages()]})
+
+
+def _local_module(value):
+    """
+    Finds the local module a module, function or class comes from.
+    :param value: Any object.
+    :return: The module, or None if it is not local (built in, standard library or installed) or has no module.
+    """
+    module = value if inspect.ismodule(value) else sys.modules.get(getattr(value, '__module__', None) or '')
+    path = getattr(module, '__file__', None)
+    if path is None or os.path.realpath(path).startswith(_LIBRARY_DIRECTORIES):
+        return None
+    return module
+
+
+def _resolve_call(name, namespace):
+    """
+    Finds the object a dotted call name refers to, e.g. "sol2.conv".
+    :param name: The dotted name, or None.
+    :param namespace: The globals of the calling function.
+    :return: The object, or None if it can not be found.
+    """
+    if name is None:
+        return None
+    first, *attributes = name.split('.')
+    value = namespace.get(first)
+    for attribute in attributes:
+        value = getattr(value, attribute, None)
+    return value
+
+
+def _module_digest(module):
+    """
+    :param module: A local module.
+    :return: The hash of its file (it may be a compiled extension rather than source code), a hex string.
+    """
+    with open(module.__file__, 'rb') as module_file:
+        return hashlib.sha256(module_file.read()).hexdigest()
+
+
+def _sol_sources(names):
+    """
+    Collects the source code of sol3 functions, and of all of the functions they call (recursively) that are defined in
+    sol3 or in other local modules (e.g. "from sol2 import conv"). The local modules other than sol3 are added as a
+    whole, since their functions may rely on anything in them.
+    :param names: Names of the sol3 functions.
+    :return: A dictionary from function name to its source code, and from "module NAME" to the digest of the module.
+    """
+    sources = {}
+    visited = set()
+    pending = [getattr(tester.sol, name, None) for name in names]
+    while pending:
+        function = pending.pop()
+        module = _local_module(function)
+        if module is None or id(function) in visited:
+            continue
+        visited.add(id(function))
+        if module is not tester.sol:
+            sources.setdefault(f"module {module.__name__}", _module_digest(module))
+        if not inspect.isfunction(function):
+            continue
+        if module is tester.sol:
+            sources[function.__qualname__] = inspect.getsource(function)
+        pending.extend(_resolve_call(call, function.__globals__) for call in tester._function_structure(function).calls)
+    return sources
+
+
+def _test_module_digests():
+    """
+    Digests the local modules the tests import (e.g. image_io), but sol3 that is fingerprinted per function.
+    :return: A dictionary from module name to its digest.
+    """
+    modules = {_local_module(value) for value in vars(tester).values()} - {None, tester, tester.sol}
+    return {module.__name__: _module_digest(module) for module in modules}
+
+
+def _sol_module_source():
+    """
+    Gets the parts of sol3 that are not functions (imports, constants, classes...), which every function may rely on.
+    :return: The source code of these parts.
+    """
+    with open(inspect.getsourcefile(tester.sol)) as source_file:
+        source = source_file.read()
+    return "\n".join(ast.get_source_segment(source, node) for node in ast.parse(source).body if
+                     not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)))
+
+
+def _fingerprint(test, seed):
+    """
+    Fingerprints everything the outcome of a test depends on: the sol3 functions it calls (and the other local modules
+    they reach), the tests' code and local modules, the test images, the settings and (for random and SEEDED_TESTS
+    tests) the seed.
+    :param test: A TestEx3 instance.
+    :param seed: The seed the random tests run with.
+    :return: The fingerprint, a hex string.
+    """
+    method_name = test._testMethodName
+    digest = hashlib.sha256()
+
+    def add(part):
+        digest.update(str(part).encode())
+        digest.update(b'\0')
+
+    add(inspect.getsource(tester))
+    for name, source in sorted(_test_module_digests().items()):
+        add(name)
+        add(source)
+    add(_sol_module_source())
+    for name, source in sorted(_sol_sources(tester.SOL_DEPENDENCIES.get(method_name, ())).items()):
+        add(name)
+        add(source)
+    for name, path in tester.ImageCorpus(tester._corpus_source()).paths.items():
+        try:
+            stat = os.stat(path)
+            add(f"{name}|{stat.st_mtime_ns}|{stat.st_size}")
+        except OSError:
+            add(f"{name}|missing")
+    for name, value in sorted(os.environ.items()):
+        if name.startswith('EX3_') and name not in _UNFINGERPRINTED_SETTINGS:
+            add(f"{name}={value}")
+    if method_name.endswith('_random') or method_name in SEEDED_TESTS:
+        add(seed)
+    return digest.hexdigest()
+
+
+def _load_incremental_state():
+    """
+    Loads the results of the previous incremental run.
+    :return: The state dictionary, empty if there was no previous run.
+    """
+    try:
+        with open(INCREMENTAL_STATE) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _replace_unchanged_tests(tests, state, seed):
+    """
+    Replaces every test whose fingerprint matches the one of its previous run with a CachedTest.
+    :param tests: The tests to run.
+    :param state: The state of the previous run.
+    :param seed: The seed the random tests run with.
+    :return: The tests to run, and a dictionary from test id to its fingerprint.
+    """
+    previous = state.get('tests', {})
+    fingerprints = {test.id(): _fingerprint(test, seed) for test in tests}
+    replaced = []
+    for test in tests:
+        entry = previous.get(test.id())
+        if entry is not None and entry['fingerprint'] == fingerprints[test.id()]:
+            replaced.append(CachedTest(test, entry['outcome'], entry['info']))
+        else:
+            replaced.append(test)
+    return replaced, fingerprints
+
+
+def _save_incremental_state(result, fingerprints, seed):
+    """
+    Saves the results of this run, for the next incremental run. Skipped tests and tests that only ran a part of their
+    cases (because of a time budget) are left out, so they run in the next run.
+    :param result: The result of this run.
+    :param fingerprints: A dictionary from test id to its fingerprint.
+    :param seed: The seed the random tests ran with.
+    :return: -
+    """
+    tests = {test_id: {'fingerprint': fingerprints[test_id], 'outcome': outcome, 'info': info}
+             for test_id, (outcome, info) in result.outcomes.items() if test_id in fingerprints and
+             outcome != SKIP and not result.case_counts.get(test_id, {}).get('skipped')}
+    with open(INCREMENTAL_STATE, 'w') as state_file:
+        json.dump({'seed': seed, 'tests': tests}, state_file, indent=2)
+
+
 def get_tests():
     """
     Generates and returns a list of all the names of tests to run through the textual interface
@@ -106,18 +608,307 @@ def get_tests():
     """
     # tests = ['test_build_gaussian_pyramid_random', 'test_build_gaussian_pyramid_static', 'test_build_laplacian_pyramid_random', 'test_build_laplacian_pyramid_static', 'test_laplacian_to_image', 'test_render_pyramid_random', 'test_render_pyramid_static']
     # return [tester.TestEx3(method) for method in tests]
-    return [tester.TestEx3(method) for method in dir(tester.TestEx3) if method.startswith('test')]
+    # Only methods, setUpClass adds settings to the class that may start with 'test' as well
+    return [tester.TestEx3(method) for method in dir(tester.TestEx3) if
+            method.startswith('test') and callable(getattr(tester.TestEx3, method))]
+
+
+# ================================ precision verification ================================
+
+
+PRECISIONS = ('float64', 'float32')
+
+
+def _test_decisions(result, records):
+    """
+    Collects the pass/fail decisions of a run.
+    :param result: The result of the run.
+    :param records: The timing records made during the run, every case record holds the outcome of the case.
+    :return: A dictionary from test id / case description to its outcome.
+    """
+    decisions = {test.id(): SUCCESS for test in get_tests()}
+    decisions.update({test.id(): FAILURE for test, _ in result.failures})
+    decisions.update({test.id(): ERROR for test, _ in result.errors})
+    for record in records:
+        if record['kind'] == CASE:
+            decisions[f"{record['test']}: {record['name']} {json.dumps(record['parameters'], sort_keys=True)}"] = \
+                record['outcome']
+    return decisions
+
+
+def verify_precision():
+    """
+    Runs every test on the images in the "external" folder (without the stress matrices) in each of the PRECISIONS,
+    and checks all of the pass/fail decisions of the tests and of the cases inside them are the same.
+    :return: True if all of the decisions match, False otherwise.
+    """
+    run_stress = tester.TestEx3.run_stress
+    tester.TestEx3.run_stress = False
+    decisions = {}
+    try:
+        for precision in PRECISIONS:
+            os.environ['EX3_PRECISION'] = precision
+            RECORDER.drain()
+            result = unittest.TestResult()
+            unittest.TestSuite(get_tests()).run(result)
+            decisions[precision] = _test_decisions(result, RECORDER.drain())
+    finally:
+        tester.TestEx3.run_stress = run_stress
+
+    reference = decisions[PRECISIONS[0]]
+    mismatches = [(name, [decisions[precision].get(name) for precision in PRECISIONS]) for name in reference if
+                  any(decisions[precision].get(name) != reference[name] for precision in PRECISIONS)]
+
+    print(f"Compared {len(reference)} decisions between {' and '.join(PRECISIONS)}, {len(mismatches)} differ")
+    for name, outcomes in mismatches:
+        print(f"    {name}: " + ", ".join(f"{precision}={outcome}" for precision, outcome in zip(PRECISIONS, outcomes)))
+    return not mismatches
+
+
+def _print_timings(amount):
+    """
+    Prints the slowest tests and the slowest cases inside them.
+    :param amount: Amount of tests/cases to print.
+    :return: -
+    """
+    for kind, title in ((TEST, "Slowest tests"), (CASE, "Slowest cases")):
+        print(f"================================================\n            ==== {title} ====\n"
+              f"================================================")
+        for record in RECORDER.slowest(amount, kind):
+            print(format_record(record))
+
+
+# Modules that are only imported once they are needed, "--import-profile" imports each of them on its own to show what
+# they cost. The tests (with the solution) are loaded when the tests are collected.
+DEFERRED_MODULES = ('test_sol3',)
+
+
+def _import_times(module_name):
+    """
+    Measures the import time of a module and of every module it imports, in a fresh interpreter using "python -X
+    importtime".
+    :param module_name: The name of the module.
+    :return: A dictionary from module name to its (self time, cumulative time) in milliseconds.
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module_name}"], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stderr
+
+    # Lines look like "import time: <self us> | <cumulative us> | <indented module name>"
+    times = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s*(\d+) \|\s*(\d+) \| \s*(\S+)", line)
+        if match:
+            times[match[3]] = (int(match[1]) / 1000, int(match[2]) / 1000)
+    return times
+
+
+def _print_import_profile(amount):
+    """
+    Prints the cold import time of the runner and of every deferred module (each in its own fresh interpreter), and
+    the slowest modules they import.
+    :param amount: Amount of slowest modules to print.
+    :return: -
+    """
+    print(f"================================================\n            ==== Import times ====\n"
+          f"================================================")
+    modules = {}
+    for name in ('runner',) + DEFERRED_MODULES:
+        times = _import_times(name)
+        modules.update(times)
+        print(f"{times.get(name, (0, 0))[1]:10.1f}ms  {name}" + ("" if name == 'runner' else " (deferred)"))
+
+    print(f"Slowest modules (self time):")
+    for name, (self_time, cumulative) in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:amount]:
+        print(f"{self_time:10.1f}ms  {name} ({cumulative:.1f}ms with its imports)")
+
+
+def _parse_args():
+    """
+    Parses the command line arguments of the textual interface.
+    :return: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Runs the ex3 tests through the textual interface.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Amount of processes to run the tests on, every image of every test is sent as its own "
+                             "case. 1 (the default) runs everything in this process.")
+    parser.add_argument('--isolate', action='store_true',
+                        help="Runs every case (every image of every test) in a sandbox worker process, so a case that "
+                             "runs out of memory or cpu time (see --case-memory-limit and --case-cpu-limit) is "
+                             "reported as 'resource exceeded' instead of taking the whole run down. Uses --workers "
+                             "processes.")
+    parser.add_argument('--case-memory-limit', type=int, metavar='MB',
+                        help="Address space limit of every --isolate worker, including the ~500MB the tests and their "
+                             "modules take.")
+    parser.add_argument('--case-cpu-limit', type=float, metavar='SECONDS',
+                        help="Cpu time limit of every --isolate case.")
+    parser.add_argument('--recycle-after', type=int, default=20, metavar='N',
+                        help="Replaces every --isolate worker with a fresh one after it ran N cases, so memory leaked "
+                             "by the solution does not pile up (0 never replaces them).")
+    parser.add_argument('--corpus', metavar='PATH',
+                        help="Runs the tests on the images of another directory, or of a manifest file listing image "
+                             "paths (one per line, relative to the manifest).")
+    parser.add_argument('--load-workers', type=int,
+                        help="Amount of threads that decode the test images at once.")
+    parser.add_argument('--image-reduction', type=int, choices=[1, 2, 4, 8],
+                        help="Scales the test images down by this factor while decoding them, for quick runs.")
+    parser.add_argument('--stress-memory-limit', type=int, metavar='MB',
+                        help="Memory ceiling for a single random stress matrix case, including the work of the tested "
+                             "function, a quarter of the physical memory by default. Cases over it are downsized or "
+                             "skipped (see --stress-oversize).")
+    parser.add_argument('--stress-oversize', choices=['downsize', 'skip'], default='downsize',
+                        help="What to do with stress cases over the memory ceiling.")
+    parser.add_argument('--reconstruct-with-sol-builds', action='store_true',
+                        help="Checks laplacian_to_image with the filter_vec returned by your pyramid functions (after "
+                             "running both of them on every image) instead of the exact binomial filter.")
+    parser.add_argument('--reconstruct-workers', type=int,
+                        help="Amount of threads laplacian_to_image runs on at once, 4 (or less cpus) by default.")
+    parser.add_argument('--tiled-stress', metavar='SIZE',
+                        help="Runs the pyramid functions tile by tile on a synthetic ROWS[xCOLS] image that is written "
+                             "to a memory mapped file in the temporary directory (deleted afterwards), so it may be "
+                             "bigger than memory (e.g. 65536 for 4 gigapixels, 16GB of disk space).")
+    parser.add_argument('--tile-size', type=int, default=2048,
+                        help="Side length of the tiles of --tiled-stress.")
+    parser.add_argument('--failfast', action='store_true',
+                        help="Stops the run at the first failing test (or case, with --workers).")
+    parser.add_argument('--test-budget', type=float, metavar='SECONDS',
+                        help="Time budget of every test (of every pool case with --workers), the cases that are left "
+                             "when it is over are skipped.")
+    parser.add_argument('--budget', type=float, metavar='SECONDS',
+                        help="Time budget of the whole run, the tests and cases that are left when it is over are "
+                             "skipped.")
+    parser.add_argument('--seed', type=int,
+                        help="Seeds the random tests, so their cases can be reproduced. A random seed is used if it "
+                             "is not given.")
+    parser.add_argument('--case', action='append', dest='cases', metavar='CASE_ID',
+                        help="Only runs the case with this id (can be given more than once), the ids are shown when "
+                             "a case fails. Use it with the same --seed to replay a random case.")
+    parser.add_argument('--shard', metavar='K/N',
+                        help="Splits the cases of every test into N shards, and only runs shard K (counted from 0).")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Only runs tests whose sol3 functions (or the functions they call), images or settings "
+                             f"changed since the last incremental run, the outcome of the rest is taken from "
+                             f"{INCREMENTAL_STATE}. The seed of the random tests is kept between runs, unless --seed "
+                             f"is given.")
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                        help="Floating point type of the images, the reference pyramids and the metrics. float32 "
+                             "halves the memory and bandwidth the tests need.")
+    parser.add_argument('--verify-precision', action='store_true',
+                        help=f"Instead of running the tests, checks that running the tests on the images in "
+                             f"{PRECISIONS} gives the same pass/fail decisions for every test and case.")
+    parser.add_argument('--timings', metavar='PATH',
+                        help="Measures the wall time, cpu time and peak memory of every test and case, prints the "
+                             "slowest ones at the end and writes all of the measurements to a JSON file at PATH.")
+    parser.add_argument('--slowest', type=int, default=10,
+                        help="Amount of tests/cases printed by --timings (or modules printed by --import-profile).")
+    parser.add_argument('--json-stream', metavar='PATH',
+                        help="Streams a JSON line per case (as soon as it finishes) and per test to a file, with its "
+                             "name, parameters, duration, outcome and message.")
+    parser.add_argument('--junit-xml', metavar='PATH',
+                        help="Writes the results of the tests to a JUnit XML file when the run ends.")
+    parser.add_argument('--import-profile', action='store_true',
+                        help="Instead of running the tests, prints the import time of the runner, the tests and the "
+                             "modules they load lazily, and the --slowest modules.")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Measures peak memory using tracemalloc (makes the tests noticeably slower).")
+    parser.add_argument('--cprofile', metavar='TEST',
+                        help="Runs the named test under cProfile, the stats are written to a TEST-<pid>.prof file "
+                             "per process, holding all of the cases the process ran.")
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    test_suite = unittest.TestSuite()
+    args = _parse_args()
+
+    # The tests read their settings from the environment, so pool workers inherit them as well
+    if args.corpus is not None:
+        os.environ['EX3_CORPUS'] = args.corpus
+    if args.load_workers is not None:
+        os.environ['EX3_LOAD_WORKERS'] = str(args.load_workers)
+    if args.reconstruct_workers is not None:
+        os.environ['EX3_RECONSTRUCT_WORKERS'] = str(args.reconstruct_workers)
+    if args.image_reduction is not None:
+        os.environ['EX3_IMAGE_REDUCTION'] = str(args.image_reduction)
+    if args.stress_memory_limit is not None:
+        os.environ['EX3_STRESS_MEMORY_LIMIT'] = str(args.stress_memory_limit)
+    os.environ['EX3_STRESS_OVERSIZE'] = args.stress_oversize
+    os.environ['EX3_PRECISION'] = args.precision
+    if args.reconstruct_with_sol_builds:
+        os.environ['EX3_RECONSTRUCT_SOL_BUILDS'] = '1'
+    if args.tiled_stress:
+        os.environ['EX3_TILED_SIZE'] = args.tiled_stress
+    os.environ['EX3_TILE_SIZE'] = str(args.tile_size)
+    if args.trace_memory:
+        os.environ['EX3_TRACE_MEMORY'] = '1'
+    if args.cprofile:
+        os.environ['EX3_CPROFILE'] = args.cprofile
+
+    if args.test_budget is not None:
+        os.environ['EX3_TEST_BUDGET'] = str(args.test_budget)
+    if args.budget is not None:
+        os.environ['EX3_DEADLINE'] = str(time.time() + args.budget)
+    if args.cases:
+        os.environ['EX3_CASES'] = ",".join(args.cases)
+    if args.shard:
+        os.environ['EX3_SHARD'] = args.shard
+
+    # A seed is always chosen here, so every pool worker draws the same cases
+    seed = args.seed
+    if args.incremental:
+        incremental_state = _load_incremental_state()
+        if seed is None:
+            seed = incremental_state.get('seed')
+    if seed is None:
+        seed = secrets.randbits(32)
+    os.environ['EX3_SEED'] = str(seed)
+
+    if args.import_profile:
+        _print_import_profile(args.slowest)
+        sys.exit(0)
+
+    if args.verify_precision:
+        sys.exit(0 if verify_precision() else 1)
+
+    if args.isolate:
+        test_suite = ParallelTestSuite(workers=args.workers, sandbox={
+            'memory_limit': None if args.case_memory_limit is None else args.case_memory_limit * 2 ** 20,
+            'cpu_limit': args.case_cpu_limit,
+            'max_tasks': args.recycle_after or None,
+        })
+    elif args.workers > 1:
+        test_suite = ParallelTestSuite(workers=args.workers)
+    else:
+        test_suite = unittest.TestSuite()
 
     tests = get_tests()
+    if args.incremental:
+        tests, fingerprints = _replace_unchanged_tests(tests, incremental_state, seed)
 
     test_suite.addTests(tests)
 
-    runner = CustomTextTestRunner(verbosity=2).run(test_suite)
-    if runner.wasSuccessful():
+    reporters = []
+    if args.json_stream:
+        reporters.append(JsonLinesReporter(args.json_stream))
+    if args.junit_xml:
+        reporters.append(JUnitReporter(args.junit_xml))
+    RECORDER.listeners.extend(reporter.case for reporter in reporters)
+
+    runner = CustomTextTestRunner(verbosity=2, failfast=args.failfast, reporters=reporters).run(test_suite)
+    for reporter in reporters:
+        reporter.close()
+    if args.incremental:
+        _save_incremental_state(runner, fingerprints, seed)
+        cached = [str(test) for test in tests if isinstance(test, CachedTest)]
+        if cached:
+            print(f"{len(cached)} tests were not run again, their inputs did not change since the last run:")
+            print("\n".join(f"    {name}" for name in cached))
+    if args.timings:
+        _print_timings(args.slowest)
+        RECORDER.write_json(args.timings)
+    if runner.wasSuccessful() and runner.budget_skipped:
+        print(f"{len(runner.budget_skipped)} tests did not run all of their cases because the time budget was over, "
+              f"run them without --budget/--test-budget to pass:")
+        print("\n".join(f"    {test}" for test in runner.budget_skipped))
+    elif runner.wasSuccessful():
         print(YOU_PASSED)
         print(DOGGO_FRAME)
         print(DOGGO)
@@ -0,0 +1,221 @@
+import math
+import queue
+import signal
+import threading
+import warnings
+import multiprocessing
+from concurrent.futures import Executor, Future
+
+try:
+    import resource
+except ImportError:  # Windows has no resource limits, the cases are still isolated in their own processes
+    resource = None
+
+
+class WorkerDied(Exception):
+    """The sandbox worker that ran a task died before it returned (e.g. it was killed for exceeding a limit)"""
+
+    def __init__(self, message, resource_exceeded):
+        """
+        :param message: What happened to the worker.
+        :param resource_exceeded: True if the worker was (most likely) killed for exceeding a resource limit.
+        """
+        super(WorkerDied, self).__init__(message)
+        self.resource_exceeded = resource_exceeded
+
+
+def _set_soft_limit(limit, value):
+    """
+    Sets the soft value of a resource limit, without going over its hard value.
+    :param limit: The resource.RLIMIT_* constant.
+    :param value: The soft value.
+    :return: -
+    """
+    hard = resource.getrlimit(limit)[1]
+    resource.setrlimit(limit, (value if hard == resource.RLIM_INFINITY else min(value, hard), hard))
+
+
+def _limit_cpu(cpu_limit):
+    """
+    Lets the process use cpu_limit more seconds of cpu time, after which it is killed by SIGXCPU. The limit counts the
+    time of the whole process, so it is moved forward before every task.
+    :param cpu_limit: The cpu time in seconds.
+    :return: -
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _set_soft_limit(resource.RLIMIT_CPU, math.ceil(usage.ru_utime + usage.ru_stime + cpu_limit))
+
+
+def _worker_main(connection, memory_limit, cpu_limit, initializer):
+    """
+    The main function of a sandbox worker, runs the tasks sent through the connection until it gets None.
+    :param connection: The worker's end of the pipe, tasks are (function, args) tuples and the results are sent back as
+                       (True, return value) or (False, exception) tuples.
+    :param memory_limit: The address space limit of the worker in bytes, or None.
+    :param cpu_limit: The cpu time limit of every task in seconds, or None.
+    :param initializer: A function that is called when the worker starts, or None.
+    :return: -
+    """
+    if initializer is not None:
+        initializer()
+    if resource is not None and memory_limit is not None:
+        _set_soft_limit(resource.RLIMIT_AS, memory_limit)
+
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        function, args = task
+        if resource is not None and cpu_limit is not None:
+            _limit_cpu(cpu_limit)
+        try:
+            result = (True, function(*args))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            connection.send(result)
+        except MemoryError:
+            connection.send((False, MemoryError("The result of the task could not be sent back")))
+        except Exception as e:
+            connection.send((False, RuntimeError(f"The result of the task could not be sent back: {e!r}")))
+
+
+class _Worker:
+    """A sandbox worker process, and the parent's end of its pipe"""
+
+    def __init__(self, context, memory_limit, cpu_limit, initializer):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, daemon=True,
+                                       args=(child_connection, memory_limit, cpu_limit, initializer))
+        self.process.start()
+
+        # Only the worker holds the other end, so reading from a dead worker raises EOFError
+        child_connection.close()
+
+    def run(self, function, args):
+        """
+        Runs a task in the worker.
+        :param function: A picklable function.
+        :param args: Its arguments.
+        :return: The (succeeded, return value or exception) tuple of the task.
+        :raises EOFError: If the worker died while running it.
+        """
+        self.connection.send((function, args))
+        return self.connection.recv()
+
+    def stop(self):
+        """Asks the worker to exit once it is done, and waits for it"""
+
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.connection.close()
+
+
+class SandboxExecutor(Executor):
+    """
+    Runs tasks in worker processes that are limited in address space and in cpu time per task, so a runaway task only
+    takes its own worker down. Every worker runs at most max_tasks tasks before it is replaced by a fresh one, so
+    memory leaked by the tasks does not pile up. A task whose worker died fails with WorkerDied.
+    """
+
+    def __init__(self, max_workers=1, memory_limit=None, cpu_limit=None, max_tasks=None, initializer=None):
+        """
+        :param max_workers: Amount of worker processes.
+        :param memory_limit: The address space limit of every worker in bytes (including everything it imported), or
+                             None for no limit.
+        :param cpu_limit: The cpu time limit of every task in seconds, or None for no limit.
+        :param max_tasks: Amount of tasks a worker runs before it is replaced, or None to keep it.
+        :param initializer: A function that is called when a worker starts, or None.
+        """
+        if resource is None and (memory_limit is not None or cpu_limit is not None):
+            warnings.warn("The resource limits are not supported on this platform, the sandbox workers run without "
+                          "them.")
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.max_tasks = max_tasks
+        self.initializer = initializer
+        # The workers are started from the serving threads, and forking a process that runs threads may deadlock the
+        # child on a lock another thread held, so they are started by a single threaded fork server (or spawned)
+        start_methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in start_methods else 'spawn')
+        self._tasks = queue.SimpleQueue()
+        self._threads = [threading.Thread(target=self._serve, daemon=True) for _ in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, /, *args, **kwargs):
+        if kwargs:
+            raise TypeError("the sandbox only passes positional arguments to its tasks")
+        future = Future()
+        self._tasks.put((future, fn, args))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if cancel_futures:
+            while True:
+                try:
+                    task = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is not None:
+                    task[0].cancel()
+        for _ in self._threads:
+            self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _describe_death(self, exitcode):
+        """
+        Explains why a worker died.
+        :param exitcode: The exit code of the worker's process.
+        :return: A WorkerDied exception.
+        """
+        if exitcode is None or exitcode >= 0:
+            return WorkerDied(f"The worker exited with code {exitcode}", False)
+        name = signal.Signals(-exitcode).name
+        if name == 'SIGKILL':
+            return WorkerDied("The worker was killed (SIGKILL), most likely by the system for running out of memory",
+                              True)
+        if name == 'SIGXCPU':
+            return WorkerDied(f"The worker went over the cpu time limit of {self.cpu_limit}s (SIGXCPU)", True)
+        return WorkerDied(f"The worker crashed ({name})", False)
+
+    def _serve(self):
+        """Feeds the tasks to a single worker at a time, replacing it when it dies or ran max_tasks tasks"""
+
+        worker, tasks = None, 0
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    return
+                future, function, args = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                if worker is None:
+                    worker, tasks = _Worker(self._context, self.memory_limit, self.cpu_limit, self.initializer), 0
+                try:
+                    succeeded, value = worker.run(function, args)
+                except (EOFError, OSError):
+                    worker.process.join()
+                    future.set_exception(self._describe_death(worker.process.exitcode))
+                    worker.connection.close()
+                    worker = None
+                    continue
+
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+                tasks += 1
+                if self.max_tasks is not None and tasks >= self.max_tasks:
+                    worker.stop()
+                    worker = None
+        finally:
+            if worker is not None:
+                worker.stop()
@@ -1,52 +1,134 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
-from imageio import imread
-from skimage.color import rgb2gray
 import numpy as np
 import sol3 as sol
+from image_io import IMAGE_EXTENSIONS, read_image
 
-def read_image(filename, representation):
-    """
-    Receives an image file and converts it into one of two given representations.
-    :param filename: The file name of an image on disk (could be grayscale or RGB).
-    :param representation: representation code, either 1 or 2 defining wether the output
-    should be a grayscale image (1) or an RGB image (2). If the input image is grayscale,
-    we won't call it with representation = 2.
-    :return: An image, represented by a matrix of type (np.float64) with intensities
-    normalized to the range [0,1].
-    """
-    assert representation in [1, 2]
-
-    # reads the image
-    im = imread(filename)
-    if representation == 1:  # If the user specified they need grayscale image,
-        if len(im.shape) == 3:  # AND the image is not grayscale yet
-            im = rgb2gray(im)  # convert to grayscale (**Assuming its RGB and not a different format**)
-
-    im_float = im.astype(np.float64)  # Convert the image type to one we can work with.
-
-    if im_float.max() > 1:  # If image values are out of bound, normalize them.
-        im_float = im_float / 255
-
-    return im_float
+PYRAMID_FUNCTIONS = {
+    'gaussian': sol.build_gaussian_pyramid,
+    'laplacian': sol.build_laplacian_pyramid,
+}
 
 
 def _show_pyramid(pyr):
-    # Code that shows the pyramid
-    for i in range(4):
-        cv2.imshow(f"level {i} of the pyramid", pyr[i])
+    # Code that shows the pyramid, a window per level
+    for i, level in enumerate(pyr):
+        cv2.imshow(f"level {i} of the pyramid", level)
     cv2.waitKey(0)
     cv2.destroyAllWindows()
 
 
 def _show_gaussian_pyr(img, max_levels, filter_size):
-    _show_pyramid(sol.build_gaussian_pyramid(img, max_levels, filter_size))
+    _show_pyramid(sol.build_gaussian_pyramid(img, max_levels, filter_size)[0])
 
 
 def _show_laplacian_pyr(img, max_levels, filter_size):
-    _show_pyramid(sol.build_laplacian_pyramid(img, max_levels, filter_size))
+    _show_pyramid(sol.build_laplacian_pyramid(img, max_levels, filter_size)[0])
+
+
+# ================================ headless export ================================
+
+
+def _to_uint8(im):
+    """
+    Stretches an image to the full [0, 255] range, so levels with any value range (e.g. laplacian ones) are visible.
+    :param im: The image.
+    :return: An 8 bit image.
+    """
+    min_val, max_val = np.min(im), np.max(im)
+    return np.round((im - min_val) * (255 / max(max_val - min_val, np.finfo(np.float64).eps))).astype(np.uint8)
+
+
+def _export_image(path, output_directory, kinds, max_levels, filter_size, per_level):
+    """
+    Builds the pyramids of a single image and writes them to the output directory, this is the function the pool
+    workers execute. Nothing but the names of the written files is sent back, so memory stays flat over many images.
+    :param path: Path of the image.
+    :param output_directory: The directory the PNG files are written to.
+    :param kinds: Kinds of pyramids to build, keys of PYRAMID_FUNCTIONS.
+    :param max_levels: The max_levels parameter.
+    :param filter_size: The filter_size parameter.
+    :param per_level: True to write every level to its own file, False to write the render_pyramid mosaic.
+    :return: A (path, written files, seconds, error) tuple, error is the message of the exception that stopped the
+             export of the image, or None.
+    """
+    start = time.perf_counter()
+    written = []
+    try:
+        im = read_image(path, 1)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for kind in kinds:
+            pyr = PYRAMID_FUNCTIONS[kind](im, max_levels, filter_size)[0]
+            images = enumerate(pyr) if per_level else [(None, sol.render_pyramid(pyr, len(pyr)))]
+            for i, image in images:
+                name = f"{stem}_{kind}.png" if i is None else f"{stem}_{kind}_level{i}.png"
+                if not cv2.imwrite(os.path.join(output_directory, name), _to_uint8(image)):
+                    raise IOError(f"could not write {name}")
+                written.append(name)
+            del pyr, images
+    except Exception as e:
+        return path, written, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return path, written, time.perf_counter() - start, None
+
+
+def export_pyramids(input_directory, output_directory, kinds, max_levels, filter_size, per_level=False, workers=None):
+    """
+    Exports the pyramids of every image in a directory, on a process pool.
+    :param input_directory: The directory of the images.
+    :param output_directory: The directory the PNG files are written to, created if needed.
+    :param kinds: Kinds of pyramids to build, keys of PYRAMID_FUNCTIONS.
+    :param max_levels: The max_levels parameter.
+    :param filter_size: The filter_size parameter.
+    :param per_level: True to write every level to its own file, False to write the render_pyramid mosaic.
+    :param workers: Amount of processes, None uses the pool's default.
+    :return: A generator of (path, written files, seconds, error) tuples (see "_export_image"), in the order of the
+             file names, yielded as soon as every image is done.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    paths = [os.path.join(input_directory, filename) for filename in sorted(os.listdir(input_directory)) if
+             filename.lower().endswith(IMAGE_EXTENSIONS)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_export_image, paths, [output_directory] * len(paths), [kinds] * len(paths),
+                            [max_levels] * len(paths), [filter_size] * len(paths), [per_level] * len(paths))
+
+
+def _parse_args():
+    """
+    Parses the command line arguments of the export tool.
+    :return: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Exports the pyramids your sol3 builds for every image in a directory "
+                                                 "as PNG files, without opening any windows.")
+    parser.add_argument('input_directory', help="Directory of the images.")
+    parser.add_argument('output_directory', help="Directory the PNG files are written to.")
+    parser.add_argument('--kinds', nargs='+', default=list(PYRAMID_FUNCTIONS), choices=list(PYRAMID_FUNCTIONS))
+    parser.add_argument('--max-levels', type=int, default=4)
+    parser.add_argument('--filter-size', type=int, default=3)
+    parser.add_argument('--per-level', action='store_true',
+                        help="Writes every level to its own file instead of the render_pyramid mosaic.")
+    parser.add_argument('--workers', type=int, help="Amount of processes, all of the cpus by default.")
+    return parser.parse_args()
+
 
+if __name__ == '__main__' and len(sys.argv) > 1:
+    args = _parse_args()
+    failed = 0
+    for path, written, seconds, error in export_pyramids(args.input_directory, args.output_directory, args.kinds,
+                                                         args.max_levels, args.filter_size, args.per_level,
+                                                         args.workers):
+        if error is None:
+            print(f"{seconds:8.2f}s  {os.path.basename(path)} -> {', '.join(written)}", flush=True)
+        else:
+            failed += 1
+            print(f"{seconds:8.2f}s  {os.path.basename(path)} FAILED: {error}", flush=True)
+    sys.exit(1 if failed else 0)
 
-if __name__ == '__main__':
+elif __name__ == '__main__':
     im = read_image(r'[YOUR IMAGE PATH HERE]', 1)
     max_levels = 4  # Enter desired levels here
     filter_size = 3  # Enter desired filter size here
@@ -1,75 +1,412 @@
 import unittest
 
 import sol3 as sol
-from imageio import imread
-from skimage.color import rgb2gray
 import numpy as np
-from sympy.ntheory import binomial_coefficients_list
 import os
+import copy
+import time
+import itertools
+import zlib
+import weakref
+import secrets
+import hashlib
+import shutil
+import tempfile
 import inspect
-import runner as run
 import ast
+import warnings
+import tracemalloc
+import threading
+from collections import OrderedDict, namedtuple, deque, Counter
+from contextlib import ExitStack, contextmanager, closing, suppress
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import RECORDER, SETUP, TEST, CASE, profile
+from image_io import IMAGE_EXTENSIONS, read_image
 
 import cv2
-from scipy.stats import pearsonr
-
-import matplotlib.pyplot as plt
 
 
 # ================================ helper functions ================================
 
 
-def read_image(filename, representation):
+# Reduced test images are never scaled below this side length. The similarity thresholds were tuned on the full sized
+# images, and the reconstruction of the cv2 pyramids of smaller ones falls below them even with a correct solution.
+MIN_REDUCED_SIDE = 512
+
+
+def _image_reduction():
+    """
+    Returns the factor the test images are scaled down by while they are decoded (down to MIN_REDUCED_SIDE), for quick
+    runs. Can be changed through the EX3_IMAGE_REDUCTION environment variable.
+    :return: 1 (full resolution), 2, 4 or 8.
+    """
+    return int(os.environ.get('EX3_IMAGE_REDUCTION', 1))
+
+
+def _image_cache_directory():
     """
-    Receives an image file and converts it into one of two given representations.
-    :param filename: The file name of an image on disk (could be grayscale or RGB).
-    :param representation: representation code, either 1 or 2 defining wether the output
-    should be a grayscale image (1) or an RGB image (2). If the input image is grayscale,
-    we won't call it with representation = 2.
-    :return: An image, represented by a matrix of type (np.float64) with intensities
-    normalized to the range [0,1].
+    Returns the directory decoded images are cached in. Can be changed through the EX3_IMAGE_CACHE environment
+    variable, setting it to an empty string disables the cache.
+    :return: The path of the directory, or None if the cache is disabled.
     """
-    assert representation in [1, 2]
+    default = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.image_cache')
+    return os.environ.get('EX3_IMAGE_CACHE', default) or None
+
 
-    # reads the image
-    im = imread(filename)
-    if representation == 1:  # If the user specified they need grayscale image,
-        if len(im.shape) == 3:  # AND the image is not grayscale yet
-            im = rgb2gray(im)  # convert to grayscale (**Assuming its RGB and not a different format**)
+def _read_cached_image(filename, representation, dtype=np.float64, reduction=None):
+    """
+    Reads an image like "read_image" does, but keeps the decoded array as a .npy file in the image cache, keyed by the
+    file's path, modification time, size and the reduction it was decoded at. Cached images are memory mapped (copy on
+    write), so warm runs skip decoding entirely and processes reading the same image share its pages. If the cache can
+    not be written (e.g. a read only or full disk), the decoded image is returned without caching it.
+    :param filename: The file name of an image on disk.
+    :param representation: representation code, see "read_image".
+    :param dtype: The floating point type of the output.
+    :param reduction: Factor to scale the image down by while decoding, see "image_io.decode". None uses
+                      "_image_reduction".
+    :return: An image, represented by a matrix of type dtype with intensities normalized to the range [0,1].
+    """
+    if reduction is None:
+        reduction = _image_reduction()
+    cache_directory = _image_cache_directory()
+    if cache_directory is None:
+        return read_image(filename, representation, dtype, reduction, MIN_REDUCED_SIDE)
+
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    # The decoder is a part of the key, entries of other decoders differ slightly (see "image_io.TOLERANCE")
+    key = f"cv2-unrotated|{path}|{stat.st_mtime_ns}|{stat.st_size}|{representation}|{np.dtype(dtype).name}|" \
+          f"{reduction}|{MIN_REDUCED_SIDE}"
+    cache_path = os.path.join(cache_directory, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode='c').view(np.ndarray)
+
+    im = read_image(path, representation, dtype, reduction, MIN_REDUCED_SIDE)
+
+    # Writes to a private file first, so concurrent runs never see half written entries
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        with open(tmp_path, 'wb') as tmp_file:
+            np.save(tmp_file, im)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        with suppress(OSError):
+            os.remove(tmp_path)
+    return im
+
+
+SimilarityMetrics = namedtuple('SimilarityMetrics', ['r', 'mse'])
+
+
+def _similarity_metrics(expected_ims, sol_ims, block_size=2 ** 18):
+    """
+    Calculates pearson's "r" coefficient and the 'Mean Squared Error' between pairs of similar shaped images.
+    Pairs with the same amount of pixels are scored together as a stack, block by block and in float64 (whatever the
+    precision of the images is). The centered sums of every block are merged into the running ones (Chan et al.'s
+    parallel algorithm), so low contrast images do not lose their precision to cancellation, and no image sized
+    temporaries are created.
+    :param expected_ims: The reference images, a stack of images (n, rows, cols) or a list of images.
+    :param sol_ims: The tested images, in the same order as expected_ims.
+    :param block_size: Amount of pixels that are processed at once, over all of the pairs of a stack.
+    :return: SimilarityMetrics of two arrays, the "r" coefficient and the mse of every pair.
+    """
+    r = np.empty(len(expected_ims))
+    mse = np.empty(len(expected_ims))
+    stacks = {}
+    for i, expected_im in enumerate(expected_ims):
+        stacks.setdefault(np.size(expected_im), []).append(i)
+
+    for n, indices in stacks.items():
+        xs = [np.ravel(expected_ims[i]) for i in indices]
+        ys = [np.ravel(sol_ims[i]) for i in indices]
+        step = max(block_size // len(indices), 1024)
+
+        count = 0
+        mean_x, mean_y, m2_x, m2_y, c_xy, sse = np.zeros((6, len(indices)))
+        for start in range(0, n, step):
+            x = np.stack([x_im[start:start + step] for x_im in xs]).astype(np.float64, copy=False)
+            y = np.stack([y_im[start:start + step] for y_im in ys]).astype(np.float64, copy=False)
+            block = x.shape[1]
+            diff = x - y
+            sse += np.einsum('ij,ij->i', diff, diff)
+
+            block_mean_x, block_mean_y = x.mean(axis=1), y.mean(axis=1)
+            x -= block_mean_x[:, None]
+            y -= block_mean_y[:, None]
+            delta_x, delta_y = block_mean_x - mean_x, block_mean_y - mean_y
+            weight = count * block / (count + block)
+            m2_x += np.einsum('ij,ij->i', x, x) + delta_x ** 2 * weight
+            m2_y += np.einsum('ij,ij->i', y, y) + delta_y ** 2 * weight
+            c_xy += np.einsum('ij,ij->i', x, y) + delta_x * delta_y * weight
+            mean_x += delta_x * block / (count + block)
+            mean_y += delta_y * block / (count + block)
+            count += block
+
+        mse[indices] = sse / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r[indices] = c_xy / np.sqrt(m2_x * m2_y)
+
+    return SimilarityMetrics(r, mse)
+
+
+def _case_rng(seed, case_id):
+    """
+    Creates the random generator of a single case of a parameter sweep.
+    :param seed: The seed of the whole sweep.
+    :param case_id: The id of the case.
+    :return: A numpy.random.Generator that only depends on the seed and the case id, so every case draws the same
+             parameters whether it runs on its own, in a shard or as a part of the whole sweep.
+    """
+    return np.random.default_rng([seed, zlib.crc32(case_id.encode())])
 
-    im_float = im.astype(np.float64)  # Convert the image type to one we can work with.
 
-    if im_float.max() > 1:  # If image values are out of bound, normalize them.
-        im_float = im_float / 255
+def _in_shard(case_id, shard):
+    """
+    Checks if a case belongs to a shard of a sweep.
+    :param case_id: The id of the case.
+    :param shard: An (index, amount) pair, the shards are numbered from 0. None means the sweep is not sharded.
+    :return: True if the case should run in the shard, False otherwise.
+    """
+    return shard is None or zlib.crc32(case_id.encode()) % shard[1] == shard[0]
+
+
+def _list_image_names(directory_path):
+    """
+    Lists the names of all the images in a directory, in the order they are loaded by "ImageCorpus".
+    :param directory_path: Path to the directory.
+    :return: A list of file names.
+    """
+    return [filename for filename in os.listdir(os.path.abspath(directory_path)) if
+            filename.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def _load_image(path, dtype):
+    """
+    Loads a single image for "ImageCorpus.load", without raising.
+    :param path: Path of the image.
+    :param dtype: The floating point type of the image.
+    :return: An (image, wall time, cpu time, error) tuple, image is None and error is the exception if loading failed.
+    """
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        im, error = _read_cached_image(path, 1, dtype), None
+    except Exception as e:
+        im, error = None, e
+    return im, time.perf_counter() - wall_start, time.thread_time() - cpu_start, error
+
+
+class ImageCorpus:
+    """
+    The test images, read from a directory (every file in it with one of the IMAGE_EXTENSIONS, in any case) or from a
+    manifest (a text file with a path per line, relative to the manifest's directory, lines starting with '#' are
+    ignored).
+    Images are decoded lazily while iterating, a few at a time on a thread pool, and the corpus keeps no reference to
+    them, so an image is freed as soon as the test moves on and the memory a run needs does not grow with the corpus.
+    """
+
+    def __init__(self, source, names=None, dtype=np.float64, workers=None):
+        """
+        :param source: Path of the directory or of the manifest.
+        :param names: Optional collection of image names, only these images will be loaded. None loads all of them.
+        :param dtype: The floating point type of the images.
+        :param workers: Amount of threads that load images, also the amount of images decoded ahead of the one in use.
+        """
+        self.source = source
+        self.dtype = dtype
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.paths = {name: path for name, path in self._list(source) if names is None or name in names}
+
+    @staticmethod
+    def _list(source):
+        """
+        Lists the images of a corpus.
+        :param source: Path of the directory or of the manifest.
+        :return: A list of (name, path) pairs, in the order the images are loaded.
+        """
+        if os.path.isdir(source):
+            directory = os.path.abspath(source)
+            return [(filename, os.path.join(directory, filename)) for filename in _list_image_names(directory)]
+
+        directory = os.path.dirname(os.path.abspath(source))
+        with open(source) as manifest:
+            lines = [line.strip() for line in manifest]
+        return [(line.replace(os.sep, '/'), os.path.join(directory, line)) for line in lines if
+                line and not line.startswith('#')]
+
+    @property
+    def names(self):
+        """
+        :return: The names of the images, in the order they are loaded.
+        """
+        return list(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def subset(self, names):
+        """
+        :param names: A collection of image names.
+        :return: A corpus of only these images.
+        """
+        corpus = copy.copy(self)
+        corpus.paths = {name: path for name, path in self.paths.items() if name in names}
+        return corpus
+
+    def __iter__(self):
+        """
+        Loads the images one after the other, see "load". Images that fail to load are reported as warnings.
+        :return: A generator of (image, image name) tuples.
+        """
+        return self.load()
+
+    def load(self, failed=None):
+        """
+        Loads the images one after the other. Every image is measured as a setup record, and images that fail to load
+        are skipped.
+        :param failed: Optional list, an (image name, exception) pair is appended to it for every image that failed to
+                       load. None reports them as warnings instead.
+        :return: A generator of (image, image name) tuples.
+        """
+        paths = iter(self.paths.items())
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            pending = deque((name, pool.submit(_load_image, path, self.dtype)) for name, path in
+                            itertools.islice(paths, self.workers))
+            while pending:
+                name, future = pending.popleft()
+                for next_name, path in itertools.islice(paths, 1):
+                    pending.append((next_name, pool.submit(_load_image, path, self.dtype)))
+
+                im, wall, cpu, error = future.result()
+                del future
+                RECORDER.add(f"load {name}", SETUP, wall, cpu, 'success' if error is None else type(error).__name__)
+                if error is not None:
+                    if failed is None:
+                        warnings.warn(f"Could not load the image {name}, the tests will run without it: {error!r}")
+                    else:
+                        failed.append((name, error))
+                    continue
+                yield im, name
+                del im
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+
+def _corpus_source():
+    """
+    Returns the corpus the tests run on, can be changed through the EX3_CORPUS environment variable.
+    :return: Path of a directory or of a manifest, see "ImageCorpus".
+    """
+    return os.environ.get('EX3_CORPUS') or IMAGES_DIRECTORY
+
+
+def _dotted_name(node):
+    """
+    Gets the dotted name of a called expression, e.g. "np.convolve" or "scipy.signal.convolve2d".
+    :param node: The "func" node of an ast.Call.
+    :return: The name, or None if the called expression is not a (dotted) name.
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        value = _dotted_name(node.value)
+        return None if value is None else f"{value}.{node.attr}"
+    return None
+
+
+class _FunctionStructure:
+    """
+    The structure of a single function: the types of all of the nodes in it (including nested functions) and the
+    dotted names of everything it calls.
+    """
+
+    __slots__ = ('node_types', 'calls')
+
+    def __init__(self, node=None):
+        self.node_types = set()
+        self.calls = set()
+        if node is not None:
+            for child in ast.walk(node):
+                self.add(child)
+
+    def add(self, node):
+        """
+        Adds a node to the structure.
+        :param node: An ast node inside the function.
+        """
+        self.node_types.add(type(node))
+        if isinstance(node, ast.Call):
+            self.calls.add(_dotted_name(node.func))
 
-    return im_float
+    def contains(self, statements):
+        """
+        :param statements: A node type, or a tuple of node types.
+        :return: True if the function contains a node of any of the types, False otherwise.
+        """
+        return any(issubclass(node_type, statements) for node_type in self.node_types)
 
 
-def _mse(im1, im2):
+class _StructureIndex:
     """
-    Calculates 'Mean Squared Error' between the two similar shaped images, which is the sum of the squared difference
-    between the two images. Normalizes the MSE.
-    The lower the error the more similar the images are.
-    :param im1: First image.
-    :param im2: Second image.
-    :return: err: The error.
+    Indexes the structure of every function in a module's source in a single pass over its syntax tree, functions are
+    indexed by their qualified names and first lines, so functions that are defined more than once (e.g. redefined, or
+    in both branches of an if) each have their own structure.
     """
-    err = np.sum((im1.astype("float") - im2.astype("float")) ** 2)
-    err /= float(im1.shape[0] * im1.shape[1])
 
-    return err
+    def __init__(self, source):
+        self.functions = {}
+        self._visit(ast.parse(source), [], [])
+
+    def _visit(self, node, owners, scope):
+        """
+        Adds a node to the structure of every function it is in, then visits its children.
+        :param node: The visited node.
+        :param owners: The structures of the functions enclosing the node.
+        :param scope: The qualified name parts of the enclosing functions and classes.
+        """
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            scope = scope + [node.name]
+            if not isinstance(node, ast.ClassDef):
+                # The first line of a function's code object is the line of its first decorator
+                first_line = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+                structure = self.functions.setdefault((".".join(scope), first_line), _FunctionStructure())
+                owners = owners + [structure]
+                scope = scope + ['<locals>']
+
+        for owner in owners:
+            owner.add(node)
+        for child in ast.iter_child_nodes(node):
+            self._visit(child, owners, scope)
+
+
+# Structure indexes of the source files that were analyzed, keyed by the hash of their content
+_structure_indexes = {}
 
 
-def _generate_images(directory_path):
+def _function_structure(function):
     """
-    Generates a list of images from a list of image names.
-    :param names: List of strings.
-    :return: A list of grayscale images.
+    Gets the structure of a function, using the (cached) structure index of the file it is defined in.
+    :param function: The function.
+    :return: The _FunctionStructure of the function.
     """
-    directory = os.path.abspath(directory_path)
-    images = [(read_image(os.path.join(directory, filename), 1), filename) for filename in os.listdir(directory) if
-              filename.endswith('.jpg')]
-    return images
+    try:
+        with open(inspect.getsourcefile(function), 'rb') as source_file:
+            source = source_file.read()
+    except (OSError, TypeError):
+        source = None
+
+    if source is not None:
+        source_hash = hashlib.sha256(source).hexdigest()
+        if source_hash not in _structure_indexes:
+            _structure_indexes[source_hash] = _StructureIndex(source)
+        structure = _structure_indexes[source_hash].functions.get((function.__qualname__,
+                                                                   function.__code__.co_firstlineno))
+        if structure is not None:
+            return structure
+
+    # Functions that can not be found in their file (e.g. lambdas) are parsed on their own
+    return _FunctionStructure(ast.parse(inspect.getsource(function)))
 
 
 def _does_contain(function, statements):
@@ -79,8 +416,7 @@ def _does_contain(function, statements):
     :param statements: The statement tokens to find.
     :return: True if there is an instance of the statements in the function implementation, False otherwise.
     """
-    nodes = ast.walk(ast.parse(inspect.getsource(function)))
-    return any(isinstance(node, statements) for node in nodes)
+    return _function_structure(function).contains(statements)
 
 
 def _uses_loop(function):
@@ -105,6 +441,125 @@ def _has_return(function):
 # -------------------------------- ex3-specifics --------------------------------
 
 
+# The stress matrices are generated in this dtype, their values are whole numbers in [0, 255) either way.
+STRESS_DTYPE = np.float32
+
+# Rough amount of float64 copies of a stress matrix that a pyramid function holds at its peak (a converted copy, the
+# pyramid levels and convolution temporaries), used to estimate how much memory a stress case needs.
+STRESS_FLOAT64_COPIES = 4
+
+# The smallest stress matrix side length, oversized cases are not downsized below it.
+MIN_STRESS_LENGTH = 2 ** 7
+
+# The default memory ceiling of a single stress case, as a fraction of the physical memory (the two random pyramid tests
+# may run their stress cases at the same time on a pool)
+DEFAULT_STRESS_MEMORY_FRACTION = 1 / 4
+
+
+def _default_stress_memory_limit():
+    """
+    Computes the memory ceiling of a stress case when none was given, see DEFAULT_STRESS_MEMORY_FRACTION.
+    :return: The ceiling in bytes, or None if the physical memory is unknown on this platform.
+    """
+    try:
+        physical_memory = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+    return int(physical_memory * DEFAULT_STRESS_MEMORY_FRACTION) if physical_memory > 0 else None
+
+
+def _stress_case_bytes(length):
+    """
+    Estimates the peak memory a single stress case needs, including the work of the tested function.
+    :param length: Side length of the square stress matrix.
+    :return: The estimation in bytes.
+    """
+    return length * length * (np.dtype(STRESS_DTYPE).itemsize + STRESS_FLOAT64_COPIES * 8)
+
+
+def _fit_stress_length(length, memory_limit, oversize):
+    """
+    Fits a stress matrix side length to the memory ceiling.
+    :param length: The requested side length.
+    :param memory_limit: The memory ceiling in bytes, None means there is no ceiling.
+    :param oversize: What to do with cases over the ceiling, 'downsize' (halves the length until it fits) or 'skip'.
+    :return: The length to use, or None if the case should be skipped.
+    """
+    if memory_limit is None:
+        return length
+    while _stress_case_bytes(length) > memory_limit:
+        if oversize == 'skip' or length // 2 < MIN_STRESS_LENGTH:
+            return None
+        length //= 2
+    return length
+
+
+@contextmanager
+def _synthetic_image_file(shape, directory=None):
+    """
+    Creates an empty memory mapped .npy file for a synthetic image of type STRESS_DTYPE, in a temporary directory. The
+    file is sparse, so it only takes the disk space of the tiles written into it (see "_synthetic_window").
+    :param shape: Shape of the image.
+    :param directory: The parent of the temporary directory, the default temporary directory if None.
+    :return: A context manager of the path of the file, the directory is deleted when it exits.
+    """
+    with tempfile.TemporaryDirectory(prefix='ex3-tiled-', dir=directory) as temp_directory:
+        path = os.path.join(temp_directory, 'image.npy')
+        image = np.lib.format.open_memmap(path, mode='w+', dtype=STRESS_DTYPE, shape=shape)
+        del image
+        yield path
+
+
+def _synthetic_window(path, row, col, tile_size, rng):
+    """
+    Writes a random tile into the file of a synthetic image, and maps it back as a window into the file.
+    :param path: Path of the image file, see "_synthetic_image_file".
+    :param row: The first row of the tile.
+    :param col: The first column of the tile.
+    :param tile_size: Side length of the tile.
+    :param rng: The random generator of the tile.
+    :return: A (tile_size, tile_size) view of the image of whole numbers in [0, 255). It is mapped copy on write, so
+             changing it does not change the file, and its mapping is dropped with it.
+    """
+    image = np.load(path, mmap_mode='r+')
+    image[row:row + tile_size, col:col + tile_size] = rng.integers(0, 255, size=(tile_size, tile_size),
+                                                                   dtype=np.uint8)
+    image.flush()
+    del image
+    return np.load(path, mmap_mode='c')[row:row + tile_size, col:col + tile_size]
+
+
+def _stress_case_specs():
+    """
+    Enumerates the stress cases of the random pyramid tests.
+    :return: A generator of (case name, (side length, max_levels)) tuples.
+    """
+    for i in range(8):
+        for j in range(9 - i):
+            yield f"stress/{i}-{j}", (2 ** (i + 7), i + 6)
+
+
+def _stress_cases(cases, filter_sizes, memory_limit=None, oversize='downsize'):
+    """
+    Lazily generates the random stress matrices for the pyramid tests, only one of them exists at a time.
+    :param cases: The selected stress cases, (case_id, rng, (side length, max_levels)) tuples as "TestEx3._sweep"
+                  generates them.
+    :param filter_sizes: The filter sizes to randomly choose from.
+    :param memory_limit: Memory ceiling for a single case in bytes, None means there is no ceiling.
+    :param oversize: What to do with cases over the ceiling, 'downsize' or 'skip'.
+    :return: A generator of (case_id, matrix, matrix_name, max_levels, filter_size) tuples.
+    """
+    for case_id, rng, (length, max_levels) in cases:
+        length = _fit_stress_length(length, memory_limit, oversize)
+        if length is None:
+            continue
+
+        # Draws in uint8 and converts once, instead of going through a (length, length) int64 matrix
+        matrix = rng.integers(0, 255, size=(length, length), dtype=np.uint8).astype(STRESS_DTYPE)
+        yield case_id, matrix, f"random(0,255)_sizeof_({length}, {length})", max_levels, rng.choice(filter_sizes)
+        del matrix
+
+
 def _cv2_build_gaussian_pyramid(im, levels):
     """
     Builds a gaussian pyramid for a given image using the built in reduce function in cv2.
@@ -140,14 +595,304 @@ def _cv2_build_laplacian_pyramid(gaussian_pyr):
     return laplacian_pyr
 
 
+# The biggest filter whose binomial coefficients (and their sum, 2 ** (size - 1)) are exact in int64
+MAX_FILTER_SIZE = 63
+
+
+def _build_binomial_filters(max_size):
+    """
+    Builds the normalized binomial filters, every row of pascal's triangle is the previous one convolved with [1, 1],
+    in exact integer arithmetic.
+    :param max_size: The biggest filter size.
+    :return: A tuple of filters indexed by their size (index 0 is None), read only arrays of shape (1, size).
+    """
+    filters = [None]
+    binom = np.ones(1, dtype=np.int64)
+    for size in range(1, max_size + 1):
+        binom_filter = (binom / np.sum(binom)).reshape(1, size)
+        binom_filter.flags.writeable = False
+        filters.append(binom_filter)
+        binom = np.convolve(binom, np.ones(2, dtype=np.int64))
+    return tuple(filters)
+
+
+_BINOMIAL_FILTERS = _build_binomial_filters(MAX_FILTER_SIZE)
+
+
+def _binomial_filter(filter_size):
+    """
+    Returns the normalized binomial filter the pyramid functions should use.
+    :param filter_size: The size of the filter, from 1 to MAX_FILTER_SIZE.
+    :return: The filter, a read only array of shape (1, filter_size).
+    """
+    return _BINOMIAL_FILTERS[filter_size]
+
+
+def _reconstruct(im, laplacian_pyr, filter_vec, sol_builds):
+    """
+    Runs laplacian_to_image on the laplacian pyramid of an image, without raising.
+    :param im: The image.
+    :param laplacian_pyr: The laplacian pyramid of the image.
+    :param filter_vec: The filter to reconstruct with.
+    :param sol_builds: True to first run the solution's pyramid functions on the image like the original test did, and
+                       reconstruct with the filter_vec they return.
+    :return: A (reconstructed image, wall time, cpu time, error) tuple, the image is None and error is the exception
+             if the solution raised one.
+    """
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        if sol_builds:
+            sol.build_gaussian_pyramid(im, len(laplacian_pyr), filter_vec.shape[1])
+            filter_vec = sol.build_laplacian_pyramid(im, len(laplacian_pyr), filter_vec.shape[1])[1]
+        new_im, error = sol.laplacian_to_image(laplacian_pyr, filter_vec.copy(), np.ones(len(laplacian_pyr))), None
+    except Exception as e:
+        new_im, error = None, e
+    return new_im, time.perf_counter() - wall_start, time.thread_time() - cpu_start, error
+
+
+def _pyramid_shapes(shape, levels):
+    """
+    Computes the level shapes of a cv2 pyramid, every level is half the size of the previous one (rounded up).
+    :param shape: The shape of the image.
+    :param levels: Amount of levels for the pyramid.
+    :return: A list of shapes.
+    """
+    shapes = [tuple(shape)]
+    for _ in range(levels - 1):
+        shapes.append(((shapes[-1][0] + 1) // 2, (shapes[-1][1] + 1) // 2))
+    return shapes
+
+
+class Pyramid:
+    """
+    A pyramid whose levels are views of a single zero initialized canvas, side by side and aligned to the top, so a
+    pyramid is a single allocation. The tests get the levels through "to_list", since solutions may change them.
+    """
+
+    __slots__ = ('canvas', 'levels', 'shapes', 'starts')
+
+    def __init__(self, shapes, dtype=np.float64):
+        """
+        :param shapes: The shapes of the levels, the first one is the biggest.
+        :param dtype: The type of the levels.
+        """
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.starts = np.cumsum([0] + [cols for _, cols in shapes]).tolist()
+        self.canvas = np.zeros((shapes[0][0], self.starts[-1]), dtype)
+        self.levels = self._views(self.canvas)
+
+    def _views(self, canvas):
+        """
+        :param canvas: The canvas, or a copy of it.
+        :return: The levels as views of the canvas.
+        """
+        return [canvas[:rows, start:start + cols] for (rows, cols), start in zip(self.shapes, self.starts)]
+
+    def to_list(self):
+        """
+        Copies the pyramid into the list form sol3 uses. The canvas is copied in a single allocation and the levels are
+        views of the copy, so callers may change them freely.
+        :return: A list of levels.
+        """
+        return self._views(self.canvas.copy())
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, index):
+        return self.levels[index]
+
+
+def _cv2_build_pyramids(im, levels, gaussian_pyr=None, laplacian_pyr=None):
+    """
+    Builds the gaussian and the laplacian pyramids of an image in a single pass using the cv2 built in reduce and
+    expand. Every level is written straight into the pyramids' canvases, and every expanded level into the same
+    scratch buffer, so apart from them nothing is allocated.
+    :param im: The given image.
+    :param levels: Amount of levels for the pyramids.
+    :param gaussian_pyr: Optional Pyramid whose first levels already hold the start of the gaussian pyramid.
+    :param laplacian_pyr: Optional Pyramid whose first levels (but the top one) already hold the start of the
+                          laplacian pyramid.
+    :return: A (gaussian_pyr, laplacian_pyr) pair of Pyramids.
+    """
+    shapes = _pyramid_shapes(im.shape, levels)
+    gaussian = Pyramid(shapes, im.dtype)
+    laplacian = Pyramid(shapes, im.dtype)
+    scratch = np.empty(im.size, im.dtype)
+
+    # Copies the levels that were already built
+    reused_gaussian = gaussian_pyr.levels[:levels] if gaussian_pyr is not None else [im]
+    reused_laplacian = laplacian_pyr.levels[:-1][:min(levels, len(reused_gaussian)) - 1] if laplacian_pyr is not None \
+        else []
+    for source, view in zip(reused_gaussian + reused_laplacian,
+                            gaussian.levels[:len(reused_gaussian)] + laplacian.levels[:len(reused_laplacian)]):
+        np.copyto(view, source)
+
+    for i in range(len(reused_gaussian), levels):
+        cv2.pyrDown(gaussian[i - 1], dst=gaussian[i], dstsize=shapes[i][::-1])
+    for i in range(len(reused_laplacian) + 1, levels):
+        expanded = scratch[:gaussian[i - 1].size].reshape(shapes[i - 1])
+        cv2.pyrUp(gaussian[i], dst=expanded, dstsize=shapes[i - 1][::-1])
+        cv2.subtract(gaussian[i - 1], expanded, dst=laplacian[i - 1])
+    np.copyto(laplacian[-1], gaussian[-1])
+    return gaussian, laplacian
+
+
+def _cv2_build_pyramids_many(images, levels, workers=None):
+    """
+    Builds the pyramids of several images, see "_cv2_build_pyramids". cv2 releases the GIL, so the images are built in
+    parallel on a thread pool.
+    :param images: The images.
+    :param levels: Amount of levels for the pyramids.
+    :param workers: Amount of threads, None uses the thread pool's default.
+    :return: A list of (gaussian_pyr, laplacian_pyr) pairs, in the order of the images.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda im: _cv2_build_pyramids(im, levels), images))
+
+
+class _ReferencePyramidCache:
+    """
+    A LRU cache of the cv2 reference pyramids, keyed by image identity and amount of levels.
+    Both pyramids of an image are built together, reusing the levels of the deepest cached pyramids of the same image:
+    a shallower pyramid is a prefix of a deeper one (only the top level of a laplacian pyramid differs), so only the
+    missing levels are computed.
+    The cache only keeps weak references to the images, the pyramids of an image are dropped once the image is freed.
+    """
+
+    def __init__(self, max_entries=16):
+        """
+        :param max_entries: Maximal amount of (gaussian, laplacian) pyramid pairs to keep, the least recently used ones
+                            are evicted first.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def gaussian(self, im, levels):
+        """
+        Returns the cv2 gaussian pyramid of an image.
+        :param im: The given image.
+        :param levels: Amount of levels for the pyramid.
+        :return: The levels, views of a fresh copy of the pyramid (see "Pyramid.to_list") that callers may change.
+        """
+        return self.pyramids(im, levels)[0].to_list()
+
+    def laplacian(self, im, levels):
+        """
+        Returns the cv2 laplacian pyramid of an image.
+        :param im: The given image.
+        :param levels: Amount of levels for the pyramid.
+        :return: The levels, views of a fresh copy of the pyramid (see "Pyramid.to_list") that callers may change.
+        """
+        return self.pyramids(im, levels)[1].to_list()
+
+    def pyramids(self, im, levels):
+        """
+        Returns the cached pyramids of an image, building them if needed.
+        :param im: The given image.
+        :param levels: Amount of levels for the pyramids.
+        :return: A (gaussian_pyr, laplacian_pyr) pair of Pyramids, shared with the cache so they must not be changed.
+        """
+        key = (id(im), levels)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0]() is im:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        pyramids = _cv2_build_pyramids(im, levels, *self._deepest_cached(im))
+        self._put(im, levels, pyramids)
+        return pyramids
+
+    def warm(self, images, levels, workers=None):
+        """
+        Builds the pyramids of several images that have nothing cached yet at once, see "_cv2_build_pyramids_many".
+        :param images: The images.
+        :param levels: Amount of levels for the pyramids.
+        :param workers: Amount of threads, None uses the thread pool's default.
+        :return: -
+        """
+        images = [im for im in images if self._deepest_cached(im)[0] is None]
+        for im, pyramids in zip(images, _cv2_build_pyramids_many(images, levels, workers)):
+            self._put(im, levels, pyramids)
+
+    def _put(self, im, levels, pyramids):
+        """
+        Adds the pyramids of an image to the cache, evicting the least recently used ones if the cache is full.
+        """
+        self._entries[(id(im), levels)] = (weakref.ref(im, self._evict), pyramids)
+        self._entries.move_to_end((id(im), levels))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict(self, im_ref):
+        """
+        Drops the pyramids of an image that was freed, called by its weak references.
+        """
+        for key in [key for key, (entry_ref, _) in self._entries.items() if entry_ref is im_ref]:
+            del self._entries[key]
+
+    def _deepest_cached(self, im):
+        """
+        Finds the deepest cached pyramids of an image.
+        :return: A (gaussian_pyr, laplacian_pyr) pair, (None, None) if there are none.
+        """
+        cached = [pyramids for entry_ref, pyramids in self._entries.values() if entry_ref() is im]
+        return max(cached, key=lambda pyramids: len(pyramids[0]), default=(None, None))
+
+
+def _find_nonzero_padding(res, level_shapes):
+    """
+    Finds a level of a rendered pyramid whose padding (the blank space below it) is not black. The padding regions are
+    computed from the level shapes and checked in place, without any image sized temporaries.
+    :param res: The rendered pyramid, the levels are placed left to right along the top of the image.
+    :param level_shapes: Shapes of the rendered levels, from the largest to the smallest.
+    :return: The index of the first level whose padding has non zero pixels, or None if all of the padding is black.
+    """
+    col = level_shapes[0][1]
+    for i in range(1, len(level_shapes)):
+        # The padding of the last level also covers everything to its right
+        end = col + level_shapes[i][1] if i < len(level_shapes) - 1 else res.shape[1]
+        if np.count_nonzero(res[level_shapes[i][0]:, col:end]):
+            return i
+        col = end
+    return None
+
+
 # ================================ unittest class ================================
 
 
+IMAGES_DIRECTORY = r'external'
+
+# Amount of images that laplacian_to_image is checked on at once
+RECONSTRUCT_BATCH_SIZE = 8
+
+# The reason of the tests that are skipped because the time budget of the run (EX3_DEADLINE) is over
+BUDGET_SKIP_REASON = "the time budget of the run is over"
+
+# The sol3 functions every test calls, a test's outcome can only change if one of them (or the functions they call) does
+SOL_DEPENDENCIES = {
+    'test_build_gaussian_pyramid_static': ('build_gaussian_pyramid',),
+    'test_build_gaussian_pyramid_random': ('build_gaussian_pyramid',),
+    'test_build_laplacian_pyramid_static': ('build_laplacian_pyramid',),
+    'test_build_laplacian_pyramid_random': ('build_laplacian_pyramid',),
+    'test_build_pyramids_tiled': ('build_gaussian_pyramid', 'build_laplacian_pyramid'),
+    'test_laplacian_to_image': ('laplacian_to_image', 'build_gaussian_pyramid', 'build_laplacian_pyramid'),
+    'test_render_pyramid_static': ('render_pyramid',),
+    'test_render_pyramid_random': ('render_pyramid',),
+}
+
+
 class TestEx3(unittest.TestCase):
     """
     The unittest testing suite.
     """
 
+    # Restricts the loaded images to these file names (None loads every image), used to split tests into cases.
+    image_names = None
+
+    # Whether the random pyramid tests should also run their stress matrices.
+    run_stress = True
+
     # ================================ setup/teardown functions ================================
 
     @classmethod
@@ -156,11 +901,152 @@ class TestEx3(unittest.TestCase):
         Generates all necessary data for tests, runs before all other tests.
         :return: -
         """
-        cls.images = _generate_images(r'external')
+        if os.environ.get('EX3_TRACE_MEMORY') and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        # The precision of the whole pipeline, the reference pyramids and the metrics follow the images' dtype
+        cls.dtype = np.dtype(os.environ.get('EX3_PRECISION', 'float64'))
+
+        # The images are only decoded while a test iterates over them
+        workers = os.environ.get('EX3_LOAD_WORKERS')
+        cls.images = ImageCorpus(_corpus_source(), cls.image_names, cls.dtype, int(workers) if workers else None)
         cls.filter_sizes = [3, 5, 7, 9]
+        cls.reference_pyramids = _ReferencePyramidCache()
+
+        # Memory ceiling (in MB, a part of the physical memory by default) for a single stress case, and what to do
+        # with cases that exceed it
+        memory_limit = os.environ.get('EX3_STRESS_MEMORY_LIMIT')
+        cls.stress_memory_limit = int(memory_limit) * 2 ** 20 if memory_limit else _default_stress_memory_limit()
+        cls.stress_oversize = os.environ.get('EX3_STRESS_OVERSIZE', 'downsize')
+
+        # Parameter sweeps: the seed (a random one if not given), the cases to replay and the shard to run
+        seed = os.environ.get('EX3_SEED')
+        cls.seed = int(seed) if seed else secrets.randbits(32)
+        cases = os.environ.get('EX3_CASES')
+        cls.selected_cases = set(cases.split(',')) if cases else None
+        shard = os.environ.get('EX3_SHARD')
+        cls.shard = tuple(int(part) for part in shard.split('/')) if shard else None
+
+        # Time budgets: seconds per test, and the (epoch) time the whole run has to end by, None means no limit
+        case_time_budget = os.environ.get('EX3_TEST_BUDGET')
+        cls.case_time_budget = float(case_time_budget) if case_time_budget else None
+        deadline = os.environ.get('EX3_DEADLINE')
+        cls.deadline = float(deadline) if deadline else None
+
+        # Whether laplacian_to_image is checked with the filter_vec of the solution's pyramid functions
+        cls.reconstruct_sol_builds = bool(os.environ.get('EX3_RECONSTRUCT_SOL_BUILDS'))
+
+        # Amount of threads laplacian_to_image runs on at once
+        reconstruct_workers = os.environ.get('EX3_RECONSTRUCT_WORKERS')
+        cls.reconstruct_workers = int(reconstruct_workers) if reconstruct_workers else min(4, os.cpu_count() or 1)
+
+        # Tiled stress mode: the "rows[xcols]" size of the synthetic image (off if not given) and the tile size
+        cls.tile_size = int(os.environ.get('EX3_TILE_SIZE', 2048))
+        tiled_size = os.environ.get('EX3_TILED_SIZE')
+        cls.tiled_shape = None
+        if tiled_size:
+            sides = [int(side) for side in tiled_size.lower().split('x')]
+            cls.tiled_shape = tuple(-(-side // cls.tile_size) * cls.tile_size for side in (sides * 2)[:2])
+
+    def setUp(self):
+        """
+        Measures every test, and runs the test named in the EX3_CPROFILE environment variable under cProfile.
+        Skips the test if the time budget of the run is over.
+        :return: -
+        """
+        # How many of the test's cases ran, passed or were skipped because the time budget was over
+        self.case_counts = Counter(ran=0, passed=0, skipped=0)
+        self.start_time = time.time()
+        if self.deadline is not None and self.start_time > self.deadline:
+            self.skipTest(BUDGET_SKIP_REASON)
+
+        measurement = RECORDER.start(self._testMethodName, TEST)
+        self.addCleanup(RECORDER.stop, measurement)
+
+        if os.environ.get('EX3_CPROFILE') == self._testMethodName:
+            stack = ExitStack()
+            stack.enter_context(profile(f"{self._testMethodName}-{os.getpid()}.prof"))
+            self.addCleanup(stack.close)
 
     # ================================ general helpers ================================
 
+    def _selected(self, case_name):
+        """
+        Checks if a case of the running test should run, according to the selected cases (EX3_CASES) and shard
+        (EX3_SHARD).
+        :param case_name: The name of the case.
+        :return: True if it should run, False otherwise.
+        """
+        case_id = f"{self._testMethodName}/{case_name}"
+        return (self.selected_cases is None or case_id in self.selected_cases) and _in_shard(case_id, self.shard)
+
+    def _out_of_time(self):
+        """
+        :return: True if the time budget of the running test (EX3_TEST_BUDGET) or of the run (EX3_DEADLINE) is over.
+        """
+        now = time.time()
+        return (self.deadline is not None and now > self.deadline) or \
+               (self.case_time_budget is not None and now - self.start_time > self.case_time_budget)
+
+    def _sweep(self, items):
+        """
+        Enumerates the cases of a parameter sweep of the running test that should run, see "_selected". Once the time
+        budget is over the rest of the cases are counted as skipped.
+        :param items: Pairs of (case name, item), the case names must be unique within the test.
+        :return: A generator of (case_id, rng, item) tuples, rng is the random generator of the case.
+        """
+        for case_name, item in items:
+            if not self._selected(case_name):
+                continue
+            if self._out_of_time():
+                self.case_counts['skipped'] += 1
+                continue
+            case_id = f"{self._testMethodName}/{case_name}"
+            yield case_id, _case_rng(self.seed, case_id), item
+
+    def _image_sweep(self, cases_per_image=None):
+        """
+        Enumerates the cases of a sweep over the images, see "_sweep". Only images that have cases to run are loaded.
+        The cases of images that failed to load count as ran, and fail the test once the other images are done.
+        :param cases_per_image: Amount of cases per image, named "{image name}/{i}". None makes a single case per image,
+                                named after the image.
+        :return: A generator of (case_id, rng, (image, image name)) tuples.
+        """
+        def case_names(name):
+            return [name] if cases_per_image is None else [f"{name}/{i}" for i in range(cases_per_image)]
+
+        names = [name for name in self.images.names if any(self._selected(case) for case in case_names(name))]
+        failed = []
+        with closing(self.images.subset(names).load(failed)) as images:
+            for img in images:
+                if self._out_of_time():
+                    # Counts the cases of the images that are left without loading them
+                    self.case_counts['skipped'] += sum(self._selected(case) for name in names[names.index(img[1]):]
+                                                       for case in case_names(name))
+                    break
+                yield from self._sweep((case_name, img) for case_name in case_names(img[1]))
+
+        if failed:
+            self.case_counts['ran'] += sum(self._selected(case) for name, _ in failed for case in case_names(name))
+            self.fail("Could not load the images:\n" + "\n".join(f"{name}: {error!r}" for name, error in failed))
+
+    @contextmanager
+    def _case(self, case_id):
+        """
+        Counts a case as ran (and as passed if the with statement ends normally), and adds the id of the case and how
+        to replay it to the message of a failure inside the with statement.
+        :param case_id: The id of the case.
+        """
+        self.case_counts['ran'] += 1
+        try:
+            yield
+            self.case_counts['passed'] += 1
+        except self.failureException as e:
+            message = e.args[0] if e.args else ""
+            e.args = (f"{message}\nCase: {case_id} (replay it using: python runner.py --seed {self.seed} "
+                      f"--case {case_id})",) + e.args[1:]
+            raise
+
     def _structure_tester(self, func, signature, no_loops, no_return):
         """
         Checks a given function's structure is correct according to the pdf.
@@ -186,28 +1072,31 @@ class TestEx3(unittest.TestCase):
         self.assertEqual(signature, str(inspect.signature(func)),
                          msg=f"{func_name} signature should be {signature} but is {str(inspect.signature(func))}")
 
-    def _compare_images(self, expected_im, sol_image, tested_im_name, tested_func_name, pearson_thresh=0.9,
-                        mse_thresh=0.05):
+    def _check_shape(self, expected_im, sol_image, tested_im_name, tested_func_name):
         """
-        Compares two images by first comparing their shape, and then checking their similarities by checking the pearson's
-        "r" coefficient is higher than "pearson_tresh" and the mse error is lower than "mse_tresh".
+        Checks a tested image has the shape of the reference image.
         :param expected_im: The reference image.
         :param sol_image: The tested image.
         :param tested_im_name: Name of the image being tested.
         :param tested_func_name: Name of the function that changed the image.
-        :param pearson_thresh: The pearson's r coefficient threshold.
-        :param mse_thresh: The mse error threshold.
-        :return:
+        :return: -
         """
         self.assertEqual(expected_im.shape, sol_image.shape,
                          msg=f"The '{tested_func_name}' function on the {tested_im_name} image should be similar to the built in output, so the output's shape should be equal to the shape of the built in shape")
-        r = pearsonr(expected_im.flatten(), sol_image.flatten())[0]
-        # print(f"for {tested_im_name}, the pearsonr was {co}")
-        #
-        # print(f"for {tested_im_name}, mse was : {self.mse(im1, im2)}")
-        #
-        # print(f"\n================\n")
-        self.assertTrue(r > pearson_thresh and _mse(expected_im, sol_image) < mse_thresh,
+
+    def _check_similarity(self, r, mse, tested_im_name, tested_func_name, pearson_thresh=0.9, mse_thresh=0.05):
+        """
+        Checks a tested image is similar to the reference image: the pearson's "r" coefficient of the two is higher than
+        "pearson_thresh" and their mse error is lower than "mse_thresh" (see "_similarity_metrics").
+        :param r: The pearson's r coefficient of the images.
+        :param mse: The mse error of the images.
+        :param tested_im_name: Name of the image being tested.
+        :param tested_func_name: Name of the function that changed the image.
+        :param pearson_thresh: The pearson's r coefficient threshold.
+        :param mse_thresh: The mse error threshold.
+        :return: -
+        """
+        self.assertTrue(r > pearson_thresh and mse < mse_thresh,
                         msg=f"The {tested_im_name} image from {tested_func_name}'s output is not so similar to the built in implementation... maybe you should used plt.imshow on the new image and see what it looks like")
 
     # ================================ Part III Tests ================================
@@ -232,8 +1121,7 @@ class TestEx3(unittest.TestCase):
         """
         name = func.__name__
         output = func(orig_matrix, max_levels, filter_size)
-        true_binom = np.array(binomial_coefficients_list(filter_size - 1))
-        true_binom = (true_binom / np.sum(true_binom)).reshape(1, true_binom.shape[0])
+        true_binom = _binomial_filter(filter_size)
         orig_shape = orig_matrix.shape
         max_val = np.max(orig_matrix)
         test_name = f"(test on : {test_name}, max_levels: {max_levels}, filter_size: {filter_size})"
@@ -265,8 +1153,8 @@ class TestEx3(unittest.TestCase):
         for i, level in enumerate(pyr):
             self.assertEqual(f"{cur_row_amount, cur_col_amount}", str(np.array(level).shape),
                              msg=f"level {i} in pyr created by {name} on the matrix named '{test_name}' should be of size ({cur_row_amount, cur_col_amount})")
-            cur_row_amount = np.int(cur_row_amount / 2)
-            cur_col_amount = np.int(cur_col_amount / 2)
+            cur_row_amount = int(cur_row_amount / 2)
+            cur_col_amount = int(cur_col_amount / 2)
 
             if name == "build_gussian_pyramid":
                 self.assertTrue((0 <= np.min(level) and np.max(level) <= max_val),
@@ -280,32 +1168,50 @@ class TestEx3(unittest.TestCase):
         :param test_name: Info about the matrix/image that is being tested.
         :param max_levels: The given max_levels parameter.
         :param filter_size: The given filter_size parameter.
-        :return: -
+        :return: The pyramid the function created.
         """
+        with RECORDER.measure(f"{func.__name__} on {test_name}", CASE, max_levels=int(max_levels),
+                              filter_size=int(filter_size)):
+            # Init variables
+            max_val, name, orig_shape, output, test_name, true_binom = self._init_pyr_module_variables(
+                filter_size, func, max_levels, orig_matrix, test_name)
 
-        # Init variables
-        max_val, name, orig_shape, output, test_name, true_binom = self._init_pyr_module_variables(filter_size, func,
-                                                                                                   max_levels,
-                                                                                                   orig_matrix,
-                                                                                                   test_name)
+            # get output vals
+            pyr, filter_vec = output
 
-        # get output vals
-        pyr, filter_vec = output
+            # Checks output shape
+            self.assertEqual(2, len(output), msg=f'{name} should return an array of length 2')
 
-        # Checks output shape
-        self.assertEqual(2, len(output), msg=f'{name} should return an array of length 2')
+            # Checks pyr is a normal python array (list)
+            self.assertEqual(type([]), type(pyr), msg=f'In {name}, pyr type should be a normal python array (list)')
 
-        # Checks pyr is a normal python array (list)
-        self.assertEqual(type([]), type(pyr), msg=f'In {name}, pyr type should be a normal python array (list)')
+            # Checks filter_vec is correct
+            self.assertEqual(f"(1, {filter_size})", str(filter_vec.shape),
+                             msg=f"filter_vec's shape should be (1, {filter_size}), but is {filter_vec.shape}")
+            self.assertIsNone(np.testing.assert_array_equal(true_binom, filter_vec,
+                                                            err_msg=f"\nERROR WAS:\nfilter_vec should look like {true_binom}, but looks like {filter_vec}\n"))
 
-        # Checks filter_vec is correct
-        self.assertEqual(f"(1, {filter_size})", str(filter_vec.shape),
-                         msg=f"filter_vec's shape should be (1, {filter_size}), but is {filter_vec.shape}")
-        self.assertIsNone(np.testing.assert_array_equal(true_binom, filter_vec,
-                                                        err_msg=f"\nERROR WAS:\nfilter_vec should look like {true_binom}, but looks like {filter_vec}\n"))
+            # Checks pyr's dimensions
+            self._check_pyr_structure(max_val, name, orig_shape, pyr, test_name, max_levels)
+        return pyr
 
-        # Checks pyr's dimensions
-        self._check_pyr_structure(max_val, name, orig_shape, pyr, test_name, max_levels)
+    def _check_pyr_value_range(self, name, pyr, max_val, test_name):
+        """
+        Checks the values of a pyramid built from a non negative matrix are in range: gaussian levels (and the top
+        level of a laplacian pyramid) are in [0, max_val]. The other laplacian levels are in [-4 * max_val, max_val],
+        as depending on the border mode, expanding a level may double values along each axis near the borders.
+        :param name: The function's name.
+        :param pyr: The pyramid.
+        :param max_val: The maximum value in the original matrix.
+        :param test_name: Info about the matrix/image that is being tested.
+        :return: -
+        """
+        tolerance = 1e-4 * max_val
+        for i, level in enumerate(pyr):
+            min_bound = 0 if name == 'build_gaussian_pyramid' or i == len(pyr) - 1 else -4 * max_val
+            min_val, level_max_val = np.min(level), np.max(level)
+            self.assertTrue(min_bound - tolerance <= min_val and level_max_val <= max_val + tolerance,
+                            msg=f"Values of level {i} of the pyr {name} created on {test_name} should be in [{min_bound}, {max_val}], but are in [{min_val}, {level_max_val}]")
 
     # -------------------------------- 3.1 helpers --------------------------------
 
@@ -320,9 +1226,10 @@ class TestEx3(unittest.TestCase):
         self._structure_tester(func, r'(im, max_levels, filter_size)', False, False)
 
         # Basic images test, fixed filter size and fixed default max_levels from pdf
-        for img in self.images:
-            self._test_pyr_module(func, img[0], img[1],
-                                  np.int(np.log(np.array(img[0]).shape[0]) - 1), 3)
+        for case_id, rng, img in self._image_sweep():
+            with self._case(case_id):
+                self._test_pyr_module(func, img[0], img[1],
+                                      int(np.log(np.array(img[0]).shape[0]) - 1), 3)
 
     def _test_pyr_random(self, func):
         """
@@ -334,18 +1241,62 @@ class TestEx3(unittest.TestCase):
         """
 
         # Basic images, random max level and random filter size
-        for img in self.images:
-            self._test_pyr_module(func, img[0], img[1],
-                                  np.random.choice(np.arange(1, np.int(np.log(np.array(img[0]).shape[0]) - 1))),
-                                  np.random.choice(self.filter_sizes))
+        for case_id, rng, img in self._image_sweep():
+            with self._case(case_id):
+                self._test_pyr_module(func, img[0], img[1],
+                                      rng.choice(np.arange(1, int(np.log(np.array(img[0]).shape[0]) - 1))),
+                                      rng.choice(self.filter_sizes))
 
         # Random stress test
-        for i in range(8):
-            length = 2 ** (i + 7)
-            for j in range(9 - i):
-                orig_matrix = np.random.randint(255, size=(length, length))
-                self._test_pyr_module(func, orig_matrix, f"random(0,255)_sizeof_({length}, {length})",
-                                      i + 6, np.random.choice(self.filter_sizes))
+        if not self.run_stress:
+            return
+        for case_id, orig_matrix, matrix_name, max_levels, filter_size in _stress_cases(
+                self._sweep(_stress_case_specs()), self.filter_sizes, self.stress_memory_limit, self.stress_oversize):
+            with self._case(case_id):
+                self._test_pyr_module(func, orig_matrix, matrix_name, max_levels, filter_size)
+
+            # Frees the matrix before the generator builds the next one
+            del orig_matrix
+
+    def _test_pyr_tiled(self, funcs):
+        """
+        Runs pyramid constructing functions on a synthetic image that may be bigger than memory, tile by tile. The image
+        is a memory mapped file in a temporary directory, every tile is written into it from the random generator of
+        its case and the functions run on a window (view) of the file, so only a single tile (and the pyramids built
+        from it) is in memory at a time. The test is skipped if the disk does not have room for the selected tiles.
+        Checks the level shapes and value ranges of every tile's pyramid, with random "max_levels" and "filter_size"
+        variables per tile.
+        :param funcs: The functions to test.
+        :return: -
+        """
+        rows, cols = self.tiled_shape
+        tile_size = self.tile_size
+        max_tile_levels = int(np.log2(tile_size // 16)) + 1
+
+        tiles = [(f"tile/{row}-{col}", (row, col)) for row in range(0, rows, tile_size) for col in
+                 range(0, cols, tile_size)]
+        needed = sum(self._selected(case_name) for case_name, _ in tiles) * tile_size ** 2 * \
+            np.dtype(STRESS_DTYPE).itemsize
+        free = shutil.disk_usage(tempfile.gettempdir()).free
+        if needed > free:
+            self.skipTest(f"the {rows}x{cols} image needs {needed / 2 ** 30:.1f}GB of disk space in "
+                          f"{tempfile.gettempdir()}, but only {free / 2 ** 30:.1f}GB are free (set TMPDIR to use another "
+                          f"directory)")
+
+        with _synthetic_image_file(self.tiled_shape) as path:
+            for case_id, rng, (row, col) in self._sweep(tiles):
+                window = _synthetic_window(path, row, col, tile_size, rng)
+                max_val = np.max(window)
+                window_name = f"tile ({row}, {col}) of a {rows}x{cols} image"
+                with self._case(case_id):
+                    for func in funcs:
+                        pyr = self._test_pyr_module(func, window, window_name, rng.integers(1, max_tile_levels + 1),
+                                                    rng.choice(self.filter_sizes))
+                        self._check_pyr_value_range(func.__name__, pyr, max_val, window_name)
+                        del pyr
+
+                # Unmaps the window before the next one is written
+                del window
 
     # -------------------------------- 3.1 tests --------------------------------
 
@@ -377,25 +1328,63 @@ class TestEx3(unittest.TestCase):
         """
         self._test_pyr_random(sol.build_laplacian_pyramid)
 
-    # -------------------------------- 3.2 test module --------------------------------
-
-    def _test_reconstruct_module(self, im, im_name):
+    def test_build_pyramids_tiled(self):
         """
-        Tests module for laplacian_to_image on a specific image.
-        :param im: The image to test.
-        :param im_name: The image's name.
+        Runs a tiled stress test on "build_gaussian_pyramid" and "build_laplacian_pyramid", only when the EX3_TILED_SIZE
+        environment variable is set.
         :return: -
         """
+        if self.tiled_shape is None:
+            self.skipTest("the tiled stress mode is off, use runner.py --tiled-stress SIZE to run it")
+        self._test_pyr_tiled([sol.build_gaussian_pyramid, sol.build_laplacian_pyramid])
 
-        my_gaussian, filter_vec = sol.build_gaussian_pyramid(im, 4, 5)
-        my_laplacian, filter_vec = sol.build_laplacian_pyramid(im, 4, 5)
-
-        gaussian_pyr = _cv2_build_gaussian_pyramid(im, 4)
-        laplacian_pyr = _cv2_build_laplacian_pyramid(gaussian_pyr)
-
-        new_im = sol.laplacian_to_image(laplacian_pyr, filter_vec, np.ones(len(laplacian_pyr)))
+    # -------------------------------- 3.2 test module --------------------------------
 
-        self._compare_images(im, new_im, im_name, r'laplacian_to_image')
+    def _test_reconstruct_batch(self, cases, levels=4, filter_size=5):
+        """
+        Tests laplacian_to_image on a batch of images. The reference pyramids of same shaped images are built together,
+        the solution runs on a pool of "reconstruct_workers" threads, and all of the outputs are scored in a single
+        metrics pass. Once the solution raises or returns a wrong shape the images after it are not reconstructed.
+        :param cases: A list of (case_id, image, image name) tuples.
+        :param levels: Amount of levels of the laplacian pyramids.
+        :param filter_size: Size of the filter to reconstruct with.
+        :return: -
+        """
+        groups = {}
+        for _, im, _ in cases:
+            groups.setdefault(im.shape, []).append(im)
+        for images in groups.values():
+            self.reference_pyramids.warm(images, levels)
+
+        filter_vec = _binomial_filter(filter_size)
+        results = []
+        with ThreadPoolExecutor(max_workers=self.reconstruct_workers) as pool:
+            futures = [pool.submit(_reconstruct, im, self.reference_pyramids.laplacian(im, levels), filter_vec,
+                                   self.reconstruct_sol_builds) for _, im, _ in cases]
+            for (_, im, _), future in zip(cases, futures):
+                results.append(future.result())
+                new_im, _, _, error = results[-1]
+                if error is not None or im.shape != np.shape(new_im):
+                    # The test ends on this case, so the images after it are cancelled
+                    for pending in futures:
+                        pending.cancel()
+                    break
+            del futures
+        cases = cases[:len(results)]
+
+        # Only outputs of the right shape are scored, the others fail on their shape check
+        scored = [i for i, ((_, im, _), (new_im, _, _, _)) in enumerate(zip(cases, results)) if
+                  new_im is not None and im.shape == np.shape(new_im)]
+        metrics = _similarity_metrics([cases[i][1] for i in scored], [results[i][0] for i in scored])
+        r, mse = np.full(len(cases), np.nan), np.full(len(cases), np.nan)
+        r[scored], mse[scored] = metrics.r, metrics.mse
+
+        for i, ((case_id, im, im_name), (new_im, wall, cpu, error)) in enumerate(zip(cases, results)):
+            with self._case(case_id), RECORDER.report(f"laplacian_to_image on {im_name}", CASE, wall, cpu):
+                if error is not None:
+                    raise error
+                self._check_shape(im, new_im, im_name, r'laplacian_to_image')
+                self._check_similarity(r[i], mse[i], im_name, r'laplacian_to_image')
 
     # -------------------------------- 3.2 test --------------------------------
 
@@ -409,9 +1398,10 @@ class TestEx3(unittest.TestCase):
         self._structure_tester(sol.laplacian_to_image, r'(lpyr, filter_vec, coeff)', False, False)
 
         # Uses a laplacian pyramid created using cv2 and compares laplacian_to_image's output on it to the original
-        # image.
-        for test_im in self.images:
-            self._test_reconstruct_module(test_im[0], test_im[1])
+        # image, a batch of images at a time.
+        cases = ((case_id, test_im[0], test_im[1]) for case_id, rng, test_im in self._image_sweep())
+        for batch in iter(lambda: list(itertools.islice(cases, RECONSTRUCT_BATCH_SIZE)), []):
+            self._test_reconstruct_batch(batch)
 
     # -------------------------------- 3.3 test module --------------------------------
 
@@ -423,36 +1413,31 @@ class TestEx3(unittest.TestCase):
         :param level: Amount of levels for the pyramid.
         :return: -
         """
+        with RECORDER.measure(f"render_pyramid on {im_name}", CASE, levels=int(level), is_lap=bool(is_lap)):
+            # Computes the gaussian/laplacian pyramid using the (cached) cv2 implementations
+            if is_lap:
+                pyr = self.reference_pyramids.laplacian(im, level)
+            else:
+                pyr = self.reference_pyramids.gaussian(im, level)
+
+            level_shapes = [lvl.shape for lvl in pyr[:level]]
+
+            # computes the render using the solution
+            res = sol.render_pyramid(pyr, level)
 
-        # Computes the gaussian/laplacian pyramid using the cv2 implementations
-        pyr = _cv2_build_gaussian_pyramid(im, level)
-        if is_lap:
-            pyr = _cv2_build_laplacian_pyramid(pyr)
-
-        # computes the render using the solution
-        res = sol.render_pyramid(pyr, level)
-
-        # computes the expected x_axis shape of the output (cols)
-        x_size = im.shape[1]
-        factor = 2
-        x_size = x_size
-        for i in range(1, level):
-            x_size += (im.shape[1] // (factor ** i))
-
-        # Compares the expected result shape to the actual shape
-        self.assertEqual(x_size, res.shape[1],
-                         msg=f"After rendering, the image's ({im_name}) x axis should be of length {x_size}, but is {res.shape[1]}, tested with {level} levels")
-        self.assertEqual(im.shape[0], res.shape[0],
-                         msg=f"After rendering, the image's ({im_name}) y axis should be of length {im.shape[0]}, but is {res.shape[0]}, tested with {level} levels")
-
-        # Checks the result was padded with zeros using a mask
-        col = im.shape[1]
-        mask = np.zeros((im.shape[0], x_size))
-        for i in range(1, level):
-            row = pyr[i].shape[0]
-            mask[row:, col:] = 1
-            col += pyr[i].shape[1]
-        self.assertTrue((res*mask == 0).all(), msg=f"The blank spaces in the rendered image should be black")
+            # computes the expected x_axis shape of the output (cols), the sum of the halved widths of the levels
+            x_size = int(np.sum(im.shape[1] >> np.arange(level)))
+
+            # Compares the expected result shape to the actual shape
+            self.assertEqual(x_size, res.shape[1],
+                             msg=f"After rendering, the image's ({im_name}) x axis should be of length {x_size}, but is {res.shape[1]}, tested with {level} levels")
+            self.assertEqual(im.shape[0], res.shape[0],
+                             msg=f"After rendering, the image's ({im_name}) y axis should be of length {im.shape[0]}, but is {res.shape[0]}, tested with {level} levels")
+
+            # Checks the result was padded with zeros below every level
+            bad_level = _find_nonzero_padding(res, level_shapes)
+            self.assertIsNone(bad_level,
+                              msg=f"The blank spaces in the rendered image should be black, but the space below level {bad_level} of the {im_name} image is not, tested with {level} levels")
 
     # -------------------------------- 3.3 tests --------------------------------
 
@@ -466,9 +1451,10 @@ class TestEx3(unittest.TestCase):
         self._structure_tester(sol.render_pyramid, r'(pyr, levels)', no_loops=False, no_return=False)
 
         # Checks on all stock memes (images)
-        for test_im in self.images:
-            self._test_reder_module(test_im[0], test_im[1], 4, is_lap=False)
-            self._test_reder_module(test_im[0], test_im[1], 4, is_lap=True)
+        for case_id, rng, test_im in self._image_sweep():
+            with self._case(case_id):
+                self._test_reder_module(test_im[0], test_im[1], 4, is_lap=False)
+                self._test_reder_module(test_im[0], test_im[1], 4, is_lap=True)
 
     def test_render_pyramid_random(self):
         """
@@ -476,13 +1462,15 @@ class TestEx3(unittest.TestCase):
         :return: -
         """
         # Checks on all stock memes (images) with random pyramid level amounts
-        for test_im in self.images:
-            for i in range(20):
-                levels = np.random.choice(np.arange(1, np.int(np.log(np.array(test_im[0]).shape[0]) - 1)))
+        for case_id, rng, test_im in self._image_sweep(20):
+            with self._case(case_id):
+                levels = rng.choice(np.arange(1, int(np.log(np.array(test_im[0]).shape[0]) - 1)))
                 self._test_reder_module(test_im[0], test_im[1], levels, is_lap=False)
                 self._test_reder_module(test_im[0], test_im[1], levels, is_lap=True)
 
 
 if __name__ == '__main__':
+    import runner as run
+
     runner = run.CustomTextTestRunner()
     unittest.main(testRunner=runner)